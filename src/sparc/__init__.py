@@ -1,4 +1,3 @@
 from pkgutil import extend_path
 
 __path__ = extend_path(__path__, __name__)
-__import__("pkg_resources").declare_namespace(__name__)
@@ -1,14 +1,11 @@
 from __future__ import annotations
 
 import logging
-import os
 from configparser import ConfigParser, SectionProxy
 from importlib import import_module
 from inspect import isabstract, isclass
-from pathlib import Path
-from pkgutil import iter_modules
 
-from .services import ServiceBase
+from .services import ServiceBase, get_services, load_service
 
 
 class SparcClient:
@@ -16,6 +13,7 @@ class SparcClient:
     The main class of the sparc.client library.
 
     This class is used to connect existing modules located in <projectbase>/services folder
+    and the services registered by other packages under the "sparc.client.services" entry point group
 
 
     Parameters:
@@ -29,28 +27,36 @@ class SparcClient:
         Calls connect() method of each of the modules.
         By default during initialization all modules are initialized and ready to be used,
         unless connect is set to False.
+    lazy : bool (False)
+        Defers importing and initializing the modules until they are first accessed
+        (e.g. client.pennsieve). The names of the available modules are still reported
+        in module_names.
 
 
     Attributes:
     -----------
     module_names : list
-        Stores the list of modules that are automatically loaded from the <projectbase>/services directory.
+        Stores the list of modules that are automatically loaded from the registry of the services.
+        In lazy mode it also includes the modules which have not been loaded yet.
     config : ConfigParser
         Config used for sparc.client
 
 
     Methods:
     --------
-    add_module(path, config, connect):
+    add_module(path, config, connect, lazy):
         Adds and optionally connects to a module in a given path with configuration variables defined in config.
     connect():
         Connects all the modules by calling their connect() functions.
+        In lazy mode, modules which have not been loaded yet are connected when first accessed.
     get_config():
         Returns config used by sparc.client
 
     """
 
-    def __init__(self, config_file: str = "config.ini", connect: bool = True) -> None:
+    def __init__(
+            self, config_file: str = "config.ini", connect: bool = True, lazy: bool = False
+    ) -> None:
 
         # Try to find config file, if not available, provide default
         self.config = ConfigParser()
@@ -67,63 +73,104 @@ class SparcClient:
 
         logging.debug("Using the following config:" + current_config)
         self.module_names = []
-
-        # iterate through the modules in the current package
-        package_dir = os.path.join(Path(__file__).resolve().parent, "services")
-
-        for _, module_name, _ in iter_modules([package_dir]):
-            # import the module and iterate through its attributes
-            self.add_module(
-                f"{__package__}.services.{module_name}", self.config[current_config], connect
-            )
+        # maps names of the modules which are not loaded yet to (path, config, connect)
+        self._lazy_modules = {}
+
+        # iterate through the registry of the services, which does not import them
+        for module_name, entry_point in get_services().items():
+            self._add_service(module_name, entry_point, self.config[current_config], connect, lazy)
+
+    def __getattr__(self, name: str):
+        # called only if the attribute was not found, i.e. the module was not loaded yet
+        lazy_modules = self.__dict__.get("_lazy_modules", {})
+        if name not in lazy_modules:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+        path, config, connect = lazy_modules[name]
+        logging.debug("Loading module %s on first access", path)
+        # the module is kept to be loaded on the next access unless the service gets created
+        self._add_service(name, path, config, connect)
+        if name not in self.__dict__:
+            raise AttributeError(f"Module {path} does not define any service")
+        return self.__dict__[name]
 
     def add_module(
             self,
             paths: str | list[str],
             config: dict | SectionProxy | None = None,
             connect: bool = True,
+            lazy: bool = False,
     ) -> None:
         """Adds and optionally connects to a module in a given path with configuration variables defined in config.
 
         Parameters:
         -----------
         paths : str or list[str]
-            a path to the module
+            a path to the module or an entry point of the service (module:class)
         config : dict or configparser.SectionProxy
             a dictionary (or Section of the config file parsed by ConfigParser) with the configuration variables
         connect : bool
             determines if the module should auto-connect
+        lazy : bool
+            determines if importing the module should be deferred until its first access
         """
         if not isinstance(paths, list):
             paths = [paths]
 
         for path in paths:
-            module_name = path.split(".")[-1] if "." in path else path
-            try:
+            module_name = path.split(":")[0].split(".")[-1]
+            self._add_service(module_name, path, config, connect, lazy)
+
+    def _add_service(
+            self,
+            module_name: str,
+            path: str,
+            config: dict | SectionProxy | None = None,
+            connect: bool = True,
+            lazy: bool = False,
+    ) -> None:
+        """Adds the service defined in a module (path) or by an entry point (module:class)."""
+        if lazy:
+            if module_name not in self.module_names:
+                self.module_names.append(module_name)
+            self._lazy_modules[module_name] = (path, config, connect)
+            return
+        try:
+            if ":" in path:
+                services = [load_service(path)]
+            else:
                 module = import_module(path)
-                for attribute_name in dir(module):
-                    attribute = getattr(module, attribute_name)
-                    if (
-                            isclass(attribute)
-                            and issubclass(attribute, ServiceBase)
-                            and not isabstract(attribute)
-                    ):
-                        # Add the class to this package's variables
+                services = [getattr(module, attribute_name) for attribute_name in dir(module)]
+            for attribute in services:
+                if (
+                        isclass(attribute)
+                        and issubclass(attribute, ServiceBase)
+                        and not isabstract(attribute)
+                ):
+                    # Add the class to this package's variables
+                    if module_name not in self.module_names:
                         self.module_names.append(module_name)
-                        c = attribute(connect=connect, config=config)
-                        setattr(self, module_name, c)
-                        if connect:
-                            c.connect()
-
-            except ModuleNotFoundError:
-                logging.debug(
-                    "Skipping module. Failed to import from %s", f"{path=}", exc_info=True
-                )
-                raise
+                    c = attribute(connect=connect, config=config)
+                    setattr(self, module_name, c)
+                    # the loaded service replaces a module registered lazily before
+                    self._lazy_modules.pop(module_name, None)
+                    if connect:
+                        c.connect()
+
+        except ModuleNotFoundError:
+            logging.debug(
+                "Skipping module. Failed to import from %s", f"{path=}", exc_info=True
+            )
+            raise
 
     def connect(self) -> bool:
         """Connects each of the modules loaded into self.module_names"""
         for module_name in self.module_names:
+            if module_name in self._lazy_modules:
+                # connect the module once it gets loaded
+                path, config, _ = self._lazy_modules[module_name]
+                self._lazy_modules[module_name] = (path, config, True)
+                continue
             module = getattr(self, module_name)
             if hasattr(module, "connect"):
                 getattr(self, module_name).connect()
@@ -1,20 +1,65 @@
-import os
 from importlib import import_module
-from inspect import isabstract, isclass
-from pathlib import Path
-from pkgutil import iter_modules
+from importlib.metadata import entry_points
 
 from ._default import ServiceBase
 
-package_dir = os.path.join(Path(__file__).resolve().parent)
+# The name of the entry point group used by third-party packages to register their services, e.g.
+# [project.entry-points."sparc.client.services"]
+# myservice = "mypackage.myservice:MyService"
+ENTRY_POINT_GROUP = "sparc.client.services"
 
+# The services shipped with sparc.client, mapping module names to "module:class" entry points.
+# The registry is static, so that importing the package does not import any of the services.
+SERVICES = {
+    "metadata": f"{__name__}.metadata:MetadataService",
+    "o2sparc": f"{__name__}.o2sparc:O2SparcService",
+    "pennsieve": f"{__name__}.pennsieve:PennsieveService",
+}
 
-# The following loop iterates through the files in the current directory,
-# checks for the python classes extending ServiceBase and adds them to global variables.
-for _, module_name, _ in iter_modules([package_dir]):
-    module = import_module(f"{__name__}.{module_name}")
-    for attribute_name in dir(module):
-        attribute = getattr(module, attribute_name)
-        if isclass(attribute) and issubclass(attribute, ServiceBase) and not isabstract(attribute):
-            # Add the class to this package's variables, so that it became visible
-            globals()[attribute_name] = attribute
+__all__ = ["ServiceBase", "ENTRY_POINT_GROUP", "SERVICES", "get_services", "load_service"] + [
+    entry_point.split(":")[1] for entry_point in SERVICES.values()
+]
+
+
+def get_services() -> dict[str, str]:
+    """Returns the available services, including the ones registered by other packages.
+
+    Returns:
+    --------
+    A dictionary mapping names of the services to their "module:class" entry points.
+    """
+    services = dict(SERVICES)
+    try:
+        group = entry_points(group=ENTRY_POINT_GROUP)
+    except TypeError:  # Python 3.9
+        group = entry_points().get(ENTRY_POINT_GROUP, [])
+    for entry_point in group:
+        # built-in services cannot be overridden
+        services.setdefault(entry_point.name, entry_point.value)
+    return services
+
+
+def load_service(entry_point: str) -> type[ServiceBase]:
+    """Imports the class of a service.
+
+    Parameters:
+    -----------
+    entry_point : str
+        A "module:class" entry point of the service.
+
+    Returns:
+    --------
+    The class of the service.
+    """
+    module_name, class_name = entry_point.split(":")
+    return getattr(import_module(module_name), class_name)
+
+
+def __getattr__(name: str):
+    # import the services on first access, e.g. `from sparc.client.services import MetadataService`
+    for entry_point in SERVICES.values():
+        if entry_point.split(":")[1] == name:
+            service = load_service(entry_point)
+            globals()[name] = service
+            return service
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,268 @@
+import copy
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+class ResponseCache:
+    """An in-memory cache of responses with LRU and TTL eviction
+
+    Parameters:
+    -----------
+    max_size : int
+        Max number of responses stored, the least recently used ones are evicted first.
+    ttl : float
+        Time (in seconds) after which a stored response expires.
+
+    Attributes:
+    -----------
+    hits : int
+        Number of responses served from the cache.
+    misses : int
+        Number of responses not found in the cache.
+
+    Methods:
+    --------
+    key(url, body) -> str
+        Returns a key of the request made to url with a JSON body.
+    get(key) -> Any
+        Returns a copy of a stored response or None if not found or expired.
+    set(key, value) -> None
+        Stores a copy of a response.
+    clear() -> None
+        Removes all the stored responses.
+    stats() -> dict
+        Returns a dictionary with the number of hits, misses and stored responses.
+    """
+
+    def __init__(self, max_size: int = 128, ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._responses = OrderedDict()
+
+    @staticmethod
+    def key(url: str, body: Optional[Any] = None) -> str:
+        """Returns a key of the request with normalized URL and canonicalized JSON body."""
+        parts = urlsplit(url)
+        query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+        url = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+        if body is None:
+            return url
+        return url + " " + json.dumps(body, sort_keys=True, separators=(",", ":"))
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._responses.get(key)
+            if item is not None and item[0] < time.time():
+                del self._responses[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._responses.move_to_end(key)
+            self.hits += 1
+            # a copy, like the responses decoded by SqliteResponseCache
+            return copy.deepcopy(item[1])
+
+    def set(self, key: str, value: Any) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._responses[key] = (time.time() + self.ttl, value)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_size:
+                self._responses.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._responses.clear()
+
+    def __len__(self) -> int:
+        return len(self._responses)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+
+class SqliteResponseCache(ResponseCache):
+    """An on-disk cache of responses stored in a SQLite database, shared between processes
+
+    Parameters:
+    -----------
+    path : str
+        The location of the SQLite database.
+    max_size : int
+        Max number of responses stored, the least recently used ones are evicted first.
+    ttl : float
+        Time (in seconds) after which a stored response expires.
+    """
+
+    def __init__(self, path: str, max_size: int = 1024, ttl: float = 300) -> None:
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.path = path
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock, self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            db.execute("DELETE FROM responses WHERE expires < ?", (now,))
+            db.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+                (self.max_size,),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM responses")
+
+    def __len__(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class FileCache:
+    """A local cache of downloaded files with size-bounded LRU eviction
+
+    The files are stored under the SHA-256 digest of their keys, e.g.
+    (datasetId, datasetVersion, path) of the published files, which never change.
+
+    Parameters:
+    -----------
+    directory : str
+        The directory where the files are stored.
+    max_size : int
+        Max total size of the files (in bytes), the least recently used ones are evicted first.
+
+    Attributes:
+    -----------
+    hits : int
+        Number of files served from the cache.
+    misses : int
+        Number of files not found in the cache.
+
+    Methods:
+    --------
+    get(key) -> str
+        Returns the location of a stored file or None if not found.
+    put(key, file_name) -> str
+        Stores a copy of a file and returns its location.
+    clear() -> None
+        Removes all the stored files.
+    stats() -> dict
+        Returns a dictionary with the number of hits, misses, stored files and their size.
+    """
+
+    def __init__(self, directory: str, max_size: int = 1024**3) -> None:
+        self.directory = os.path.abspath(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: tuple) -> str:
+        digest = hashlib.sha256("/".join(str(k) for k in key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _files(self) -> list:
+        """Returns (last access, size, location) of the stored files."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir():
+                for file in os.scandir(entry.path):
+                    if not file.name.endswith(".tmp"):
+                        stat = file.stat()
+                        files.append((stat.st_mtime, stat.st_size, file.path))
+        return files
+
+    def get(self, key: tuple) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            try:
+                # mark the file as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return path
+
+    def put(self, key: tuple, file_name: str) -> str:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(file_name, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = sorted(self._files())
+            size = sum(file[1] for file in files)
+            for _, file_size, path in files:
+                if size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in self._files():
+                os.remove(path)
+
+    def __len__(self) -> int:
+        return len(self._files())
+
+    def stats(self) -> dict:
+        files = self._files()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "count": len(files),
+            "size": sum(file[1] for file in files),
+        }
@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+from typing import Iterable, List, Optional
+
+
+class FileManifest:
+    """A local index of the files of a dataset version stored in a SQLite database
+
+    The files are listed once and then filtered locally, without requests to the API.
+
+    Parameters:
+    -----------
+    dataset_id : int
+        The id of the dataset.
+    version : int
+        The version of the dataset.
+    path : str
+        The location of the SQLite database, kept in memory by default.
+
+    Methods:
+    --------
+    add(files) -> int
+        Stores the files (e.g. from list_files()) and returns their number.
+    query(...) -> list
+        Returns the files matching a path glob, file type and size.
+    paths(...) -> list
+        Returns the paths of the files matching a path glob, file type and size.
+    clear() -> None
+        Removes all the stored files.
+    close() -> None
+        Closes the database.
+    """
+
+    def __init__(self, dataset_id: int, version: int, path: str = ":memory:") -> None:
+        self.dataset_id = dataset_id
+        self.version = version
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files (dataset_id INTEGER, version INTEGER, "
+                "path TEXT, file_type TEXT, size INTEGER, file TEXT, "
+                "PRIMARY KEY (dataset_id, version, path))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS files_type ON files (file_type)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_size ON files (size)")
+
+    @staticmethod
+    def file_path(file: dict) -> str:
+        """Returns the path of a file within its dataset."""
+        if file.get("uri") is None:
+            return file["name"]
+        return "/".join(file["uri"].split("/")[5:])
+
+    def add(self, files: Iterable[dict]) -> int:
+        rows = (
+            (
+                self.dataset_id,
+                self.version,
+                self.file_path(file),
+                (file.get("fileType") or "").lower(),
+                file.get("size"),
+                json.dumps(file),
+            )
+            for file in files
+        )
+        with self._lock, self._db as db:
+            count = db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return count.rowcount
+
+    def _select(
+        self,
+        columns: str,
+        glob: Optional[str],
+        file_type: Optional[str],
+        min_size: Optional[int],
+        max_size: Optional[int],
+        limit: Optional[int],
+    ) -> list:
+        sql = f"SELECT {columns} FROM files WHERE dataset_id = ? AND version = ?"
+        params = [self.dataset_id, self.version]
+        if glob is not None:
+            sql += " AND path GLOB ?"
+            params.append(glob)
+        if file_type is not None:
+            sql += " AND file_type = ?"
+            params.append(file_type.lower())
+        if min_size is not None:
+            sql += " AND size >= ?"
+            params.append(min_size)
+        if max_size is not None:
+            sql += " AND size <= ?"
+            params.append(max_size)
+        sql += " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def query(
+        self,
+        glob: str = None,
+        file_type: str = None,
+        min_size: int = None,
+        max_size: int = None,
+        limit: int = None,
+    ) -> List[dict]:
+        """Returns the files matching specified criteria, ordered by their paths.
+
+        Parameters:
+        -----------
+        glob : str
+            A pattern of the paths (e.g. "primary/*.json"), * matches also /.
+        file_type : str
+            Type of file, case insensitive.
+        min_size : int
+            Min size of file in bytes.
+        max_size : int
+            Max size of file in bytes.
+        limit : int
+            Max number of files returned, all of them if None.
+
+        Returns:
+        --------
+        A list of files with their parameters, as returned by list_files().
+        """
+        rows = self._select("file", glob, file_type, min_size, max_size, limit)
+        return [json.loads(row[0]) for row in rows]
+
+    def paths(
+        self,
+        glob: str = None,
+        file_type: str = None,
+        min_size: int = None,
+        max_size: int = None,
+        limit: int = None,
+    ) -> List[str]:
+        """Returns the paths of the files matching specified criteria.
+
+        See also
+        --------
+        query()
+        """
+        return [row[0] for row in self._select("path", glob, file_type, min_size, max_size, limit)]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM files WHERE dataset_id = ? AND version = ?",
+                (self.dataset_id, self.version),
+            ).fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock, self._db as db:
+            db.execute(
+                "DELETE FROM files WHERE dataset_id = ? AND version = ?",
+                (self.dataset_id, self.version),
+            )
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,35 @@
+import threading
+import time
+from typing import Hashable
+
+
+class RateLimiter:
+    """A thread-safe limiter of the number of calls per second, counted separately per key
+
+    Parameters:
+    -----------
+    rate : float
+        Max number of calls per second for each key (e.g. a host), unlimited if None.
+
+    Methods:
+    --------
+    acquire(key) -> float
+        Waits until a call for the key is allowed and returns the time waited.
+    """
+
+    def __init__(self, rate: float = None) -> None:
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def acquire(self, key: Hashable = None) -> float:
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            # reserve the next free slot, so that the waiting callers are served in order
+            slot = max(now, self._next.get(key, now))
+            self._next[key] = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+        return slot - now
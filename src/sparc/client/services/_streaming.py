@@ -0,0 +1,108 @@
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Sequence
+
+WHITESPACE = " \t\n\r"
+
+
+class _Buffer:
+    """A text buffer filled incrementally with decoded chunks of bytes"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.text = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """Reads the next chunk, dropping the text already consumed."""
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self.eof = True
+            return False
+        self.text = self.text[self.pos :] + self._decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Returns the next non-whitespace character, or an empty string at the end."""
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.more():
+                return ""
+
+    def decode(self, decode_function) -> Any:
+        """Decodes a value at the current position, reading more chunks if needed."""
+        while True:
+            try:
+                value, end = decode_function(self.text, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # a number at the end of the buffer could continue in the next chunk
+            if end == len(self.text) and not self.eof and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_items(chunks: Iterable[bytes], path: Sequence[str]) -> Iterator[Any]:
+    """Iterates over the items of a JSON array without decoding the whole document.
+
+    Only a single item is decoded and kept in memory at a time.
+
+    Parameters:
+    -----------
+    chunks : iterable(bytes)
+        Chunks of a UTF-8 encoded JSON document (e.g. Response.iter_content()).
+    path : sequence(str)
+        Keys of the nested objects leading to the array (e.g. ("hits", "hits")).
+
+    Returns:
+    --------
+    An iterator over the items of the array, empty if the array was not found.
+    """
+    decoder = json.JSONDecoder()
+    buffer = _Buffer(chunks)
+    path = list(path)
+    # keys of the objects (or None for arrays) enclosing the current position
+    stack = []
+    expect_key = False
+
+    while True:
+        char = buffer.peek()
+        if char == "":
+            return
+        if char in ",:":
+            buffer.pos += 1
+            expect_key = char == "," and bool(stack) and stack[-1] is not None
+        elif char == '"':
+            string = buffer.decode(lambda text, pos: json.decoder.scanstring(text, pos + 1))
+            if expect_key:
+                stack[-1] = string
+                expect_key = False
+        elif char == "[" and stack == path:
+            buffer.pos += 1
+            while True:
+                char = buffer.peek()
+                if char == "]" or char == "":
+                    return
+                if char == ",":
+                    buffer.pos += 1
+                    continue
+                yield buffer.decode(decoder.raw_decode)
+        elif char in "{[":
+            buffer.pos += 1
+            stack.append("" if char == "{" else None)
+            expect_key = char == "{"
+        elif char in "}]":
+            buffer.pos += 1
+            stack.pop()
+        else:
+            # skip numbers, true, false and null
+            buffer.pos += 1
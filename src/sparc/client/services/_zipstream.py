@@ -0,0 +1,209 @@
+import io
+import struct
+import zlib
+from typing import BinaryIO, Iterable, Iterator, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, BadZipFile
+
+LOCAL_FILE_HEADER = b"PK\x03\x04"
+DATA_DESCRIPTOR = b"PK\x07\x08"
+# central directory records, which follow the last entry
+CENTRAL_DIRECTORY = (b"PK\x01\x02", b"PK\x05\x05", b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07")
+READ_SIZE = 64 * 1024
+
+
+class _Stream:
+    """A byte stream read from chunks, with the ability to push back unused bytes"""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self._pos = 0
+
+    def read1(self, size: int) -> bytes:
+        """Returns up to size bytes, reading at most a single chunk."""
+        while self._pos >= len(self._buffer):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._buffer, self._pos = chunk, 0
+        data = self._buffer[self._pos : self._pos + size]
+        self._pos += len(data)
+        return data
+
+    def read(self, size: int) -> bytes:
+        """Returns size bytes, or less at the end of the stream."""
+        data = b""
+        while len(data) < size:
+            chunk = self.read1(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.read(size)
+        if len(data) < size:
+            raise BadZipFile("Truncated archive")
+        return data
+
+    def unread(self, data: bytes) -> None:
+        self._buffer, self._pos = data + self._buffer[self._pos :], 0
+
+
+class _ZipEntry(io.RawIOBase):
+    """A file-like object reading a single entry of a streamed archive"""
+
+    def __init__(
+        self, stream: _Stream, name: str, flags: int, method: int, header: tuple, extra: bytes
+    ) -> None:
+        super().__init__()
+        self.name = name
+        self._stream = stream
+        self._flags = flags
+        self._method = method
+        self._crc = 0
+        self._size = 0
+        self._eof = False
+        self._output = b""
+        self._pending = b""
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+        self.expected_crc, self.compressed_size, self.expected_size = header
+        self._zip64 = False
+        while len(extra) >= 4:
+            # the sizes are stored in the zip64 extra field if they do not fit in the header
+            tag, length = struct.unpack("<HH", extra[:4])
+            if tag == 0x0001:
+                self._zip64 = True
+                values = list(struct.unpack(f"<{length // 8}Q", extra[4 : 4 + length // 8 * 8]))
+                if self.expected_size == 0xFFFFFFFF and values:
+                    self.expected_size = values.pop(0)
+                if self.compressed_size == 0xFFFFFFFF and values:
+                    self.compressed_size = values.pop(0)
+            extra = extra[4 + length :]
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._output and not self._eof:
+            self._output = self._read_more(len(buffer))
+        data, self._output = self._output[: len(buffer)], self._output[len(buffer) :]
+        buffer[: len(data)] = data
+        return len(data)
+
+    def _read_more(self, size: int) -> bytes:
+        if self._method == ZIP_STORED and self._flags & 0x08 and self.compressed_size == 0:
+            data = self._read_until_descriptor()
+        elif self._method == ZIP_STORED:
+            remaining = self.compressed_size - self._size
+            if remaining == 0:
+                self._finish()
+                return b""
+            data = self._stream.read1(min(size, remaining))
+            if not data:
+                raise BadZipFile(f"Truncated entry {self.name}")
+        else:
+            if self._decompressor.eof:
+                self._stream.unread(self._decompressor.unused_data)
+                self._finish()
+                return b""
+            compressed = self._decompressor.unconsumed_tail or self._stream.read1(READ_SIZE)
+            if not compressed:
+                raise BadZipFile(f"Truncated entry {self.name}")
+            data = self._decompressor.decompress(compressed, size)
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        return data
+
+    def _read_until_descriptor(self) -> bytes:
+        """Reads a stored entry of unknown size, which ends with a data descriptor.
+
+        The entry ends before the descriptor signature followed by the checksum
+        and the size of the data read so far.
+        """
+        if self._pending is None:
+            self._finish()
+            return b""
+        size_format = "<IQ" if self._zip64 else "<II"
+        descriptor_size = len(DATA_DESCRIPTOR) + struct.calcsize(size_format)
+        start = 0
+        while True:
+            index = self._pending.find(DATA_DESCRIPTOR, start)
+            if index >= 0 and len(self._pending) >= index + descriptor_size:
+                crc, size = struct.unpack_from(size_format, self._pending, index + 4)
+                data = self._pending[:index]
+                if size == self._size + index and crc == zlib.crc32(data, self._crc):
+                    self._stream.unread(self._pending[index:])
+                    self._pending = None
+                    return data
+                start = index + 1
+                continue
+            if index < 0 and len(self._pending) >= len(DATA_DESCRIPTOR):
+                # the descriptor could start only in the last few bytes
+                keep = len(DATA_DESCRIPTOR) - 1
+                data, self._pending = self._pending[:-keep], self._pending[-keep:]
+                return data
+            chunk = self._stream.read1(READ_SIZE)
+            if not chunk:
+                raise BadZipFile(f"Truncated entry {self.name}")
+            self._pending += chunk
+
+    def _finish(self) -> None:
+        self._eof = True
+        if self._flags & 0x08:
+            # the checksum and sizes follow the data in a data descriptor
+            signature = self._stream.read_exact(4)
+            if signature != DATA_DESCRIPTOR:
+                self._stream.unread(signature)
+            size_format = "<QQ" if self._zip64 else "<II"
+            crc = struct.unpack("<I", self._stream.read_exact(4))[0]
+            _, size = struct.unpack(
+                size_format, self._stream.read_exact(struct.calcsize(size_format))
+            )
+            self.expected_crc, self.expected_size = crc, size
+        if self._crc != self.expected_crc or self._size != self.expected_size:
+            raise BadZipFile(f"Bad CRC-32 or size of entry {self.name}")
+
+    def drain(self) -> None:
+        """Reads the rest of the entry."""
+        while self.read(READ_SIZE):
+            pass
+
+
+def iter_zip_entries(chunks: Iterable[bytes]) -> Iterator[Tuple[str, BinaryIO]]:
+    """Iterates over the entries of a ZIP archive while it is being downloaded.
+
+    Only the local headers are used, so the archive is never stored. Each entry
+    has to be read before the next one, the unread rest of it is skipped.
+
+    Parameters:
+    -----------
+    chunks : iterable(bytes)
+        Chunks of the archive (e.g. Response.iter_content()).
+
+    Returns:
+    --------
+    An iterator over (name, file-like object) pairs of the entries.
+    """
+    stream = _Stream(chunks)
+    while True:
+        signature = stream.read(4)
+        if not signature or signature in CENTRAL_DIRECTORY:
+            return
+        if signature != LOCAL_FILE_HEADER:
+            raise BadZipFile("Bad magic number for file header")
+        _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = (
+            struct.unpack("<HHHHHIIIHH", stream.read_exact(26))
+        )
+        name = stream.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = stream.read_exact(extra_length)
+        if flags & 0x01:
+            raise BadZipFile(f"Entry {name} is encrypted")
+        if method not in (ZIP_STORED, ZIP_DEFLATED):
+            raise BadZipFile(f"Compression method {method} of entry {name} is not supported")
+
+        entry = _ZipEntry(stream, name, flags, method, (crc, compressed_size, size), extra)
+        yield name, entry
+        entry.drain()
+        entry.close()
@@ -1,12 +1,24 @@
+import asyncio
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from configparser import SectionProxy
-from typing import Optional, Union
+from typing import AsyncIterator, Iterable, Iterator, List, NamedTuple, Optional, Union
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
+from ._cache import ResponseCache, SqliteResponseCache
 from ._default import ServiceBase
+from ._streaming import iter_json_items
+
+
+class DatasetRecord(NamedTuple):
+    """A compact record of a dataset found by Elasticsearch"""
+
+    id: str
+    score: Optional[float]
+    source: dict
 
 
 class MetadataService(ServiceBase):
@@ -16,6 +28,10 @@ class MetadataService(ServiceBase):
     -----------
     config : dict
         A configuration containing necessary API key (scicrunch_api_key).
+        Optionally, the size of the HTTP connection pool (metadata_pool_size) and
+        the settings of the response cache (metadata_cache_ttl, metadata_cache_size,
+        metadata_cache_path). The cache is enabled if metadata_cache_ttl is defined
+        and stored in a SQLite database if metadata_cache_path is defined.
     connect : bool
         Not needed with REST metadata services.
 
@@ -25,6 +41,10 @@ class MetadataService(ServiceBase):
         A dictionary with headers to make HTTP requests.
     host_api : str
         A default HTTP address of the SciCrunch Elasticsearch API endpoint.
+    pool_size : int
+        The number of connections kept alive in the HTTP session.
+    cache : ResponseCache
+        An optional cache of the responses, disabled (None) by default.
 
     Methods:
     --------
@@ -33,7 +53,7 @@ class MetadataService(ServiceBase):
     set_profile() -> str
         Changes the API Key.
     close() : None
-        Not needed with REST metadata services.
+        Closes the HTTP session.
     getURL(...) : dict
         Supporting function to retrieve data from REST endpoint via GET
         This support Elasticsearch URL based queries
@@ -44,6 +64,16 @@ class MetadataService(ServiceBase):
         Returns a dictionary with datasets metadata.
     search_datasets(...) : dict
         Returns a dictionary with datasets matching search criteria.
+    search_datasets_batch(...) : list
+        Returns a list of dictionaries with datasets matching each of the search criteria.
+    iter_datasets(...) : Iterator[dict]
+        Iterates over all the datasets matching search criteria, page by page.
+    stream_datasets(...) : Iterator[dict]
+        Iterates over the datasets matching search criteria, decoding the response incrementally.
+    to_records(...) : list[DatasetRecord]
+        Converts the results into compact records.
+    alist_datasets(...), asearch_datasets(...), aiter_datasets(...)
+        Asynchronous (asyncio) variants of the functions above.
 
     """
 
@@ -54,6 +84,8 @@ class MetadataService(ServiceBase):
 
     scicrunch_api_key: str = None
     profile_name: str = None
+    pool_size: int = 10
+    cache: Optional[ResponseCache] = None
 
     def __init__(
         self, config: Optional[Union[dict, SectionProxy]] = None, connect: bool = False
@@ -69,10 +101,16 @@ class MetadataService(ServiceBase):
             logging.info("SciCrunch API Key: Found")
             self.profile_name = config.get("pennsieve_profile_name")
             logging.info("Profile: " + self.profile_name)
+            self.pool_size = int(config.get("metadata_pool_size", self.pool_size))
+            if config.get("metadata_cache_ttl") is not None:
+                self.cache = self._create_cache(config)
 
         if self.scicrunch_api_key is None:
             logging.error("SciCrunch API Key: Not Found")
 
+        self._session = self._create_session()
+        self._executor = None
+
     def connect(self) -> str:
         """Not needed as metadata services are REST service calls"""
         logging.info("Metadata REST services available...")
@@ -109,71 +147,174 @@ class MetadataService(ServiceBase):
         return self.scicrunch_api_key
 
     def close(self) -> None:
-        """Not needed as metadata services are REST service calls"""
+        """Closes the HTTP session and its pooled connections"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._session.close()
         return None
 
     #####################################################################
     # Supporting Functions
 
     #####################################################################
-    # Function to GET content from URL with retries
-    def getURL(self, url, headers=None):
+    # Function to create a pooled HTTP session with retries, reused by all calls
+    def _create_session(self) -> requests.Session:
+        url_session = requests.Session()
+        retries = Retry(
+            total=6,
+            backoff_factor=1,
+            status_forcelist=[404, 413, 429, 500, 502, 503, 504],
+        )
+
+        url_session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=self.pool_size,
+                pool_maxsize=self.pool_size,
+                max_retries=retries,
+            ),
+        )
+        return url_session
 
-        with requests.Session() as url_session:
-            retries = Retry(
-                total=6,
-                backoff_factor=1,
-                status_forcelist=[404, 413, 429, 500, 502, 503, 504],
+    #####################################################################
+    # Function to run a blocking call in a thread pool bounded by the size of the HTTP pool
+    async def _run_async(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.pool_size, thread_name_prefix="metadata"
             )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
 
-            url_session.mount("https://", HTTPAdapter(max_retries=retries))
+    #####################################################################
+    # Function to create a response cache from the config section
+    @staticmethod
+    def _create_cache(config: Union[dict, SectionProxy]) -> ResponseCache:
+        ttl = float(config.get("metadata_cache_ttl"))
+        path = config.get("metadata_cache_path")
+        if path is None:
+            return ResponseCache(max_size=int(config.get("metadata_cache_size", 128)), ttl=ttl)
+        logging.info("Metadata cache: " + path)
+        return SqliteResponseCache(
+            path, max_size=int(config.get("metadata_cache_size", 1024)), ttl=ttl
+        )
 
-            if headers is None:
-                url_result = url_session.get(url)
-            else:
-                url_result = url_session.get(url, headers=headers)
+    #####################################################################
+    # Function to GET content from URL with retries
+    def getURL(self, url, headers=None):
+        if self.cache is not None:
+            cache_key = self.cache.key(url)
+            cached_result = self.cache.get(cache_key)
+            if cached_result is not None:
+                logging.info("Cached:" + url)
+                return cached_result
+
+        if headers is None:
+            url_result = self._session.get(url)
+        else:
+            url_result = self._session.get(url, headers=headers)
 
-            logging.info("HTTP " + str(url_result.status_code) + ":" + url)
+        logging.info("HTTP " + str(url_result.status_code) + ":" + url)
 
-            return url_result.json()
+        result = url_result.json()
+        if self.cache is not None and url_result.status_code == 200:
+            self.cache.set(cache_key, result)
+        return result
 
     #####################################################################
     # Function to retrieve content via POST from URL with retries
     def postURL(self, url, body, headers=None):
         result = {}
 
-        with requests.Session() as url_session:
-            retries = Retry(
-                total=6,
-                backoff_factor=1,
-                status_forcelist=[404, 413, 429, 500, 502, 503, 504],
-            )
+        if type(body) is dict:
+            body_json = body
+        elif type(body) is str:
+            body_json = json.loads(body)
+        else:
+            result["status"] = 400
+            result["message"] = "Bad JSON body - not a proper query string"
+            return result
+
+        if self.cache is not None:
+            cache_key = self.cache.key(url, body_json)
+            cached_result = self.cache.get(cache_key)
+            if cached_result is not None:
+                logging.info("Cached:" + url)
+                return cached_result
+
+        request_headers = self.default_headers if headers is None else headers
+        if self.scicrunch_api_key is not None:
+            request_headers["apikey"] = self.scicrunch_api_key
 
-            url_session.mount("https://", HTTPAdapter(max_retries=retries))
+        url_result = self._session.post(url, json=body_json, headers=request_headers)
 
-            if type(body) is dict:
-                body_json = body
-            elif type(body) is str:
-                body_json = json.loads(body)
-            else:
-                result["status"] = 400
-                result["message"] = "Bad JSON body - not a proper query string"
-                return result
+        logging.info("HTTP " + str(url_result.status_code) + ":" + url)
+
+        result = url_result.json()
+        if self.cache is not None and url_result.status_code == 200:
+            self.cache.set(cache_key, result)
+        return result
+
+    #####################################################################
+    # Function to retrieve content via POST from URL, decoding the hits incrementally
+    # Returns an iterator over the hits or a json with the error
+    def _postURL_stream(self, url, body_json, chunk_size=65536):
+        request_headers = dict(self.default_headers)
+        if self.scicrunch_api_key is not None:
+            request_headers["apikey"] = self.scicrunch_api_key
+
+        url_result = self._session.post(url, json=body_json, headers=request_headers, stream=True)
 
-            request_headers = self.default_headers if headers is None else headers
-            if self.scicrunch_api_key is not None:
-                request_headers["apikey"] = self.scicrunch_api_key
+        logging.info("HTTP " + str(url_result.status_code) + ":" + url)
 
-            url_result = url_session.post(url, json=body_json, headers=request_headers)
+        if url_result.status_code != 200:
+            with url_result:
+                try:
+                    return url_result.json()
+                except ValueError:
+                    return {"status": url_result.status_code, "message": url_result.text}
 
-            logging.info("HTTP " + str(url_result.status_code) + ":" + url)
+        def iter_hits():
+            with url_result:
+                yield from iter_json_items(url_result.iter_content(chunk_size), ("hits", "hits"))
 
-            return url_result.json()
+        return iter_hits()
+
+    #####################################################################
+    # Function to add _source filtering of the fields to an Elasticsearch JSON query
+    @staticmethod
+    def _filter_source(query, fields=None, exclude_fields=None) -> dict:
+        body_json = json.loads(query) if type(query) is str else dict(query)
+        source = body_json.get("_source", True)
+        if source is False:
+            # no fields are returned anyway
+            return body_json
+        if source is True:
+            source = {}
+        elif type(source) in (str, list):
+            source = {"includes": [source] if type(source) is str else source}
+        else:
+            source = dict(source)
+        # the fields are merged with the filtering of the query
+        for key, values in (("includes", fields), ("excludes", exclude_fields)):
+            if values is not None:
+                existing = source.get(key, [])
+                existing = [existing] if type(existing) is str else existing
+                source[key] = list(dict.fromkeys([*existing, *values]))
+        body_json["_source"] = source
+        return body_json
 
     #####################################################################
     # Metadata Search Functions
 
-    def list_datasets(self, limit: int = 10, offset: int = 0) -> list:
+    def list_datasets(
+        self,
+        limit: int = 10,
+        offset: int = 0,
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+    ) -> list:
         """Lists datasets and associated metadata.
 
         Parameters:
@@ -182,6 +323,12 @@ class MetadataService(ServiceBase):
             Max number of datasets returned.
         offset : int
             Offset used for pagination of results.
+        fields : list(str)
+            Fields of the datasets returned, all of them if None (e.g. ["item.name"]).
+        exclude_fields : list(str)
+            Fields of the datasets not returned (e.g. ["contributors", "objects"]).
+            The fields can be filtered only by the scicrunch endpoint, ValueError
+            is raised for other endpoints.
 
         Returns:
         --------
@@ -193,15 +340,26 @@ class MetadataService(ServiceBase):
 
         if "api.scicrunch.io" not in self.algolia_api:
             # If user changes URL don't add ES specific information
+            if fields is not None or exclude_fields is not None:
+                raise ValueError(f"Filtering of the fields is not supported by {self.algolia_api}")
             list_url = self.algolia_api
         else:
             list_url = self.algolia_api + "?" + "from=" + str(offset) + "&size=" + str(limit)
+            if fields is not None:
+                list_url += "&_source=" + ",".join(fields)
+            if exclude_fields is not None:
+                list_url += "&_source_excludes=" + ",".join(exclude_fields)
             request_headers["apikey"] = self.scicrunch_api_key
 
         list_results = self.getURL(list_url, headers=request_headers)
         return list_results
 
-    def search_datasets(self, query: str = '{"query": { "match_all": {}}}') -> list:
+    def search_datasets(
+        self,
+        query: str = '{"query": { "match_all": {}}}',
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+    ) -> list:
         """Gets datasets matching specified query.
 
         This function provides
@@ -210,6 +368,10 @@ class MetadataService(ServiceBase):
         -----------
         query : str
             Elasticsearch JSON query.
+        fields : list(str)
+            Fields of the datasets returned, all of them if None (e.g. ["item.name"]).
+        exclude_fields : list(str)
+            Fields of the datasets not returned (e.g. ["contributors", "objects"]).
 
         Returns:
         --------
@@ -219,9 +381,277 @@ class MetadataService(ServiceBase):
 
         request_headers = self.default_headers
 
+        if (fields is not None or exclude_fields is not None) and type(query) in (str, dict):
+            query = self._filter_source(query, fields, exclude_fields)
+
         if "api.scicrunch.io" in self.algolia_api:
             # If user hasn't changed URL add ES specific information
             request_headers["apikey"] = self.scicrunch_api_key
 
         search_results = self.postURL(self.algolia_api, body=query, headers=request_headers)
         return search_results
+
+    def iter_datasets(
+        self,
+        query: Union[str, dict] = '{"query": { "match_all": {}}}',
+        page_size: int = 100,
+        max_items: Optional[int] = None,
+        sort: Optional[list] = None,
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> Iterator[dict]:
+        """Iterates over all datasets matching specified query, fetching them page by page.
+
+        Only a single page of results (or a single dataset if stream is True, see
+        stream_datasets()) is kept in memory. If sort is provided, the pages are
+        fetched with search_after cursors, otherwise (or if the endpoint does not support
+        search_after) with from/size pagination, which Elasticsearch limits to 10000 results.
+
+        Parameters:
+        -----------
+        query : str or dict
+            Elasticsearch JSON query.
+        page_size : int
+            Number of datasets fetched with a single request.
+        max_items : int
+            Max number of datasets returned, all of them if None.
+        sort : list
+            Elasticsearch sort, which needs to define a unique order of datasets
+            (e.g. [{"pennsieve.identifier": "asc"}]).
+        fields : list(str)
+            Fields of the datasets returned, all of them if None (e.g. ["item.name"]).
+        exclude_fields : list(str)
+            Fields of the datasets not returned (e.g. ["contributors", "objects"]).
+        stream : bool
+            Determines if the responses should be decoded incrementally.
+
+        Returns:
+        --------
+        An iterator over the hits with the datasets.
+
+        """
+        body = json.loads(query) if type(query) is str else dict(query)
+        body["size"] = page_size
+        if sort is not None:
+            body["sort"] = sort
+        if fields is not None or exclude_fields is not None:
+            body = self._filter_source(body, fields, exclude_fields)
+
+        count = 0
+        use_search_after = sort is not None
+        while max_items is None or count < max_items:
+            if not use_search_after:
+                body["from"] = count
+            if stream:
+                result = self._postURL_stream(self.algolia_api, body)
+            else:
+                result = self.search_datasets(body)
+
+            if isinstance(result, dict) and "hits" not in result:
+                if use_search_after and "search_after" in body:
+                    logging.warning("search_after is not supported, falling back to from/size.")
+                    use_search_after = False
+                    body.pop("search_after")
+                    continue
+                raise RuntimeError(f"Failed to retrieve datasets: {result}")
+
+            hits = iter(result["hits"]["hits"]) if isinstance(result, dict) else result
+            page_count = 0
+            last_hit = None
+            try:
+                for hit in hits:
+                    page_count += 1
+                    count += 1
+                    last_hit = hit
+                    yield hit
+                    if count == max_items:
+                        break
+            finally:
+                # release the streamed response also if the consumer stops early
+                if stream:
+                    hits.close()
+
+            if page_count < page_size or count == max_items:
+                break
+            if use_search_after:
+                body["search_after"] = last_hit["sort"]
+
+    def stream_datasets(
+        self,
+        query: Union[str, dict] = '{"query": { "match_all": {}}}',
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+        chunk_size: int = 65536,
+    ) -> Iterator[dict]:
+        """Gets datasets matching specified query, decoding the response incrementally.
+
+        The hits are decoded one by one while the response is downloaded, so that only
+        a single dataset is kept in memory. The responses are not cached.
+
+        Parameters:
+        -----------
+        query : str or dict
+            Elasticsearch JSON query.
+        fields : list(str)
+            Fields of the datasets returned, all of them if None (e.g. ["item.name"]).
+        exclude_fields : list(str)
+            Fields of the datasets not returned (e.g. ["contributors", "objects"]).
+        chunk_size : int
+            Number of bytes of the response read at once.
+
+        Returns:
+        --------
+        An iterator over the hits with the datasets.
+
+        """
+        if fields is not None or exclude_fields is not None:
+            body = self._filter_source(query, fields, exclude_fields)
+        else:
+            body = json.loads(query) if type(query) is str else query
+
+        result = self._postURL_stream(self.algolia_api, body, chunk_size)
+        if isinstance(result, dict):
+            raise RuntimeError(f"Failed to retrieve datasets: {result}")
+        return result
+
+    @staticmethod
+    def to_records(results: Union[dict, Iterable[dict]]) -> List[DatasetRecord]:
+        """Converts the results into compact records of the datasets.
+
+        Parameters:
+        -----------
+        results : dict or iterable(dict)
+            A json with the results (e.g. from search_datasets()) or the hits
+            (e.g. from iter_datasets()).
+
+        Returns:
+        --------
+        A list of DatasetRecord with id, score and source of each dataset.
+
+        """
+        hits = results["hits"]["hits"] if isinstance(results, dict) else results
+        return [DatasetRecord(h.get("_id"), h.get("_score"), h.get("_source", {})) for h in hits]
+
+    def search_datasets_batch(
+        self,
+        queries: list,
+        chunk_size: int = 50,
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+    ) -> list:
+        """Gets datasets matching each of specified queries.
+
+        The queries are sent in chunks with Elasticsearch _msearch requests, so that
+        N queries require ceil(N / chunk_size) requests.
+
+        Parameters:
+        -----------
+        queries : list(str or dict)
+            Elasticsearch JSON queries.
+        chunk_size : int
+            Max number of queries sent with a single request.
+        fields : list(str)
+            Fields of the datasets returned, all of them if None (e.g. ["item.name"]).
+        exclude_fields : list(str)
+            Fields of the datasets not returned (e.g. ["contributors", "objects"]).
+
+        Returns:
+        --------
+        A list of jsons with the results, in the order of the queries.
+
+        """
+        if not self.algolia_api.endswith("/_search"):
+            raise ValueError(f"Batch search is not supported by {self.algolia_api}")
+        msearch_url = self.algolia_api[: -len("_search")] + "_msearch"
+
+        request_headers = dict(self.default_headers)
+        request_headers["Content-Type"] = "application/x-ndjson"
+        if self.scicrunch_api_key is not None:
+            request_headers["apikey"] = self.scicrunch_api_key
+
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            lines = []
+            for query in queries[start : start + chunk_size]:
+                if fields is not None or exclude_fields is not None:
+                    body_json = self._filter_source(query, fields, exclude_fields)
+                else:
+                    body_json = json.loads(query) if type(query) is str else query
+                lines.append("{}")
+                lines.append(json.dumps(body_json))
+            body = ("\n".join(lines) + "\n").encode("utf-8")
+
+            url_result = self._session.post(msearch_url, data=body, headers=request_headers)
+            logging.info("HTTP " + str(url_result.status_code) + ":" + msearch_url)
+
+            result = url_result.json()
+            if "responses" not in result:
+                raise RuntimeError(f"Failed to retrieve datasets: {result}")
+            results.extend(result["responses"])
+        return results
+
+    #####################################################################
+    # Asynchronous Metadata Search Functions
+
+    async def alist_datasets(
+        self,
+        limit: int = 10,
+        offset: int = 0,
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+    ) -> list:
+        """Lists datasets and associated metadata without blocking the event loop.
+
+        See also
+        --------
+        list_datasets()
+        """
+        return await self._run_async(self.list_datasets, limit, offset, fields, exclude_fields)
+
+    async def asearch_datasets(
+        self,
+        query: str = '{"query": { "match_all": {}}}',
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+    ) -> list:
+        """Gets datasets matching specified query without blocking the event loop.
+
+        The requests share the HTTP session (and its retries) with the blocking functions,
+        and at most pool_size of them are executed concurrently.
+
+        See also
+        --------
+        search_datasets()
+        """
+        return await self._run_async(self.search_datasets, query, fields, exclude_fields)
+
+    async def aiter_datasets(
+        self,
+        query: Union[str, dict] = '{"query": { "match_all": {}}}',
+        page_size: int = 100,
+        max_items: Optional[int] = None,
+        sort: Optional[list] = None,
+        fields: Optional[List[str]] = None,
+        exclude_fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> AsyncIterator[dict]:
+        """Iterates over all datasets matching specified query without blocking the event loop.
+
+        See also
+        --------
+        iter_datasets()
+        """
+        pages = self.iter_datasets(
+            query, page_size, max_items, sort, fields, exclude_fields, stream
+        )
+        end = object()
+        try:
+            while True:
+                hit = await self._run_async(next, pages, end)
+                if hit is end:
+                    return
+                yield hit
+        finally:
+            # closes the streamed response if the consumer stops early
+            await self._run_async(pages.close)
@@ -1,16 +1,23 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import logging
 import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor
 from configparser import SectionProxy
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import Any
+from tempfile import TemporaryDirectory, mkdtemp
+from typing import Any, AsyncIterator, Callable, Iterable, NamedTuple
 from zipfile import ZipFile, is_zipfile
 
 import osparc
 from osparc.models.profile import Profile
 
+from ._cache import ResponseCache, SqliteResponseCache
 from ._default import ServiceBase
 
 # ConfigDict: TypeAlias = Union[dict[str, Any], SectionProxy]
@@ -18,12 +25,91 @@ from ._default import ServiceBase
 # JobId: TypeAlias = str
 
 
+class JobStatus(NamedTuple):
+    """A snapshot of the status of a job"""
+
+    job_id: str
+    state: str
+    progress: float
+    done: bool
+
+    @classmethod
+    def from_osparc(cls, job_id: str, status: osparc.JobStatus) -> JobStatus:
+        return cls(
+            job_id=job_id,
+            state=status.state,
+            progress=float(status.progress / 100),
+            done=status.stopped_at is not None,
+        )
+
+
+class LazyFile:
+    """A handle of an output file of a job, downloaded when its path is first accessed
+
+    The handle could be passed to open() and other functions accepting os.PathLike.
+    """
+
+    def __init__(self, file: osparc.File, download: Callable[[osparc.File], Path]) -> None:
+        self.file = file
+        self._download = download
+        self._path: Path | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> Path:
+        """The location of the downloaded file."""
+        with self._lock:
+            if self._path is None:
+                self._path = self._download(self.file)
+            return self._path
+
+    @property
+    def downloaded(self) -> bool:
+        return self._path is not None
+
+    def __fspath__(self) -> str:
+        return str(self.path)
+
+    def __repr__(self) -> str:
+        return f"LazyFile(id={self.file.id!r}, filename={self.file.filename!r})"
+
+
 class O2SparcSolver:
     """
     Wrapper for osparc.Solver
+
+    Parameters:
+    -----------
+    api_client: osparc.ApiClient
+        The client of the osparc API.
+    solver_key: str
+        Solver key
+    solver_version: str
+        Solver version
+    upload_cache: ResponseCache
+        An optional store mapping the SHA-256 checksums of the uploaded input files
+        to the osparc files, so that unchanged inputs are not uploaded again.
+    executor: ThreadPoolExecutor
+        The executor running the blocking calls of the async functions (e.g. asubmit_job),
+        created on demand with max_workers threads if None. The executor created on demand
+        is shut down by close() or at the exit of a with block, a given one is not.
     """
 
-    def __init__(self, api_client: osparc.ApiClient, solver_key: str, solver_version: str):
+    hash_chunk_size = 1024 * 1024
+    download_chunk_size = 1024 * 1024
+    max_workers = 16
+
+    def __init__(
+        self,
+        api_client: osparc.ApiClient,
+        solver_key: str,
+        solver_version: str,
+        upload_cache: ResponseCache | None = None,
+        executor: ThreadPoolExecutor | None = None,
+    ):
+        self._upload_cache: ResponseCache | None = upload_cache
+        self._executor: ThreadPoolExecutor | None = executor
+        self._owns_executor: bool = False
         self._files_api: osparc.FilesApi = osparc.FilesApi(api_client)
         self._solvers_api: osparc.SolversApi = osparc.SolversApi(api_client)
         self._solver: osparc.Solver = self._solvers_api.get_solver_release(
@@ -31,6 +117,147 @@ class O2SparcSolver:
         )
         self._jobs: list[osparc.Job] = []
 
+    async def _run_async(self, function: Callable, *args) -> Any:
+        """
+        Runs a blocking call in the executor, without blocking the event loop.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="o2sparc"
+            )
+            self._owns_executor = True
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def close(self) -> None:
+        """
+        Shuts down the executor created on demand by the async functions.
+        """
+        if self._owns_executor:
+            self._executor.shutdown()
+            self._executor = None
+            self._owns_executor = False
+
+    def __enter__(self) -> O2SparcSolver:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def _hash_file(self, path: Path) -> tuple[str, str]:
+        """
+        Returns the SHA-256 and MD5 checksums of a file, read in chunks.
+        """
+        sha256 = hashlib.sha256()
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.hash_chunk_size), b""):
+                sha256.update(chunk)
+                md5.update(chunk)
+        return sha256.hexdigest(), md5.hexdigest()
+
+    def _upload_file(self, path: Path, checksums: tuple[str, str] | None = None) -> osparc.File:
+        """
+        Uploads a file, unless a file with the same content was uploaded before.
+
+        A file found in the upload cache is reused if it still exists on the server
+        and its checksum (if known) matches the content. The file is uploaded directly
+        if its checksums are not known.
+        """
+        if checksums is None or self._upload_cache is None:
+            return self._files_api.upload_file(path)
+
+        sha256, md5 = checksums
+        cached = self._upload_cache.get("sha256:" + sha256)
+        if cached is not None:
+            try:
+                file: osparc.File = self._files_api.get_file(cached["id"])
+                if file.checksum is None or file.checksum == md5:
+                    logging.info(f"Reusing uploaded file {file.id} for {path}")
+                    return file
+            except osparc.ApiException:
+                logging.info(f"The uploaded file {cached['id']} is no longer available")
+
+        file = self._files_api.upload_file(path)
+        self._upload_cache.set("sha256:" + sha256, {"id": file.id, "filename": file.filename})
+        return file
+
+    def _upload_files(
+        self, files: Iterable[Path], max_workers: int = 1
+    ) -> dict[Path, osparc.File]:
+        """
+        Uploads distinct files concurrently, each of them once.
+
+        The files are identified by their content, so that copies of a file are uploaded once.
+        Only the files looked up in the upload cache or of the same size as another file are
+        hashed, the others are uploaded directly. Returns a dictionary mapping the resolved
+        paths to the uploaded files.
+        """
+        paths: list[Path] = list(dict.fromkeys(file.resolve() for file in files))
+        sizes: dict[Path, int] = {path: path.stat().st_size for path in paths}
+        if self._upload_cache is None:
+            # only the files of the same size can have the same content
+            counts = Counter(sizes.values())
+            hashed = [path for path in paths if counts[sizes[path]] > 1]
+        else:
+            hashed = paths
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            checksums: dict[Path, tuple[str, str]] = dict(
+                zip(hashed, executor.map(self._hash_file, hashed))
+            )
+            # the files which are not hashed are identified by their paths
+            keys: dict[Path, tuple[str, str] | Path] = {
+                path: checksums.get(path, path) for path in paths
+            }
+            contents: dict[tuple[str, str] | Path, Path] = {}
+            for path, key in keys.items():
+                contents.setdefault(key, path)
+            uploaded: dict[tuple[str, str] | Path, osparc.File] = dict(
+                zip(
+                    contents,
+                    executor.map(
+                        self._upload_file,
+                        contents.values(),
+                        [checksums.get(path) for path in contents.values()],
+                    ),
+                )
+            )
+        return {path: uploaded[key] for path, key in keys.items()}
+
+    def _job_inputs(
+        self, job_inputs: dict[str, str | int | float | Path], files: dict[Path, osparc.File]
+    ) -> dict[str, str | int | float | osparc.File]:
+        """
+        Replaces the paths of job inputs with the uploaded files.
+        """
+        return {
+            key: files[inp.resolve()] if isinstance(inp, Path) else inp
+            for key, inp in job_inputs.items()
+        }
+
+    def _check_files(self, job_inputs: dict[str, str | int | float | Path]) -> list[Path]:
+        """
+        Returns the files of job inputs, raises RuntimeError if any of the paths is not a file.
+        """
+        files: list[Path] = []
+        for key, inp in job_inputs.items():
+            if isinstance(inp, Path):
+                if not inp.is_file():
+                    raise RuntimeError(f"Input {key} is not a file.")
+                files.append(inp)
+        return files
+
+    def _start_job(self, inputs: dict[str, str | int | float | osparc.File]) -> osparc.Job:
+        """
+        Creates and starts a job.
+        """
+        job: osparc.Job = self._solvers_api.create_job(
+            self._solver.id, self._solver.version, osparc.JobInputs(inputs)
+        )
+        self._solvers_api.start_job(self._solver.id, self._solver.version, job.id)
+        return job
+
     def submit_job(self, job_inputs: dict[str, str | int | float | Path]) -> str:
         """
         Submit a job to the solver/computational service.
@@ -44,22 +271,80 @@ class O2SparcSolver:
         --------
         A string representing the job id.
         """
-        inputs: dict[str, str | int | float | osparc.File] = {}
-        for key in job_inputs:
-            inp = job_inputs[key]
-            if isinstance(inp, Path):
-                if not inp.is_file():
-                    raise RuntimeError(f"Input {key} is not a file.")
-                inputs[key] = self._files_api.upload_file(inp)
+        files = self._upload_files(self._check_files(job_inputs))
+        job: osparc.Job = self._start_job(self._job_inputs(job_inputs, files))
+        self._jobs.append(job)
+        return job.id
+
+    def submit_jobs(
+        self, jobs_inputs: list[dict[str, str | int | float | Path]], max_workers: int = 4
+    ) -> list[str]:
+        """
+        Submit multiple jobs to the solver/computational service.
+
+        The distinct input files of all the jobs are uploaded concurrently, each of them once,
+        then the jobs are created and started concurrently.
+
+        Parameters:
+        -----------
+        jobs_inputs: List[Dict[str, str | int | float | pathlib.Path]]
+            The inputs of each job, see submit_job.
+        max_workers: int
+            Max number of files uploaded or jobs started concurrently.
+
+        Returns:
+        --------
+        A list of the job ids, in the order of jobs_inputs.
+
+        If any of the jobs fails to start, RuntimeError is raised once all of them are
+        submitted. Its job_ids attribute lists the ids of the started jobs in the order
+        of jobs_inputs, with None in place of the failed ones.
+        """
+        paths: list[Path] = [path for inputs in jobs_inputs for path in self._check_files(inputs)]
+        files = self._upload_files(paths, max_workers)
+
+        def start(job_inputs: dict[str, str | int | float | Path]) -> str:
+            job: osparc.Job = self._start_job(self._job_inputs(job_inputs, files))
+            # recorded at once, so that a failure of another job does not orphan it
+            self._jobs.append(job)
+            return job.id
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(start, job_inputs) for job_inputs in jobs_inputs]
+        job_ids: list[str | None] = []
+        errors: list[BaseException] = []
+        for future in futures:
+            if future.exception() is None:
+                job_ids.append(future.result())
             else:
-                inputs[key] = inp
+                job_ids.append(None)
+                errors.append(future.exception())
+        if errors:
+            error = RuntimeError(
+                f"{len(errors)} of {len(jobs_inputs)} jobs failed to start, "
+                f"the started jobs: {[job_id for job_id in job_ids if job_id is not None]}"
+            )
+            error.job_ids = job_ids
+            raise error from errors[0]
+        return job_ids
+
+    def get_job_status(self, job_id: str) -> JobStatus:
+        """
+        Get the job status
 
-        job: osparc.Job = self._solvers_api.create_job(
-            self._solver.id, self._solver.version, osparc.JobInputs(inputs)
+        Parameters:
+        -----------
+        job_id: str
+            The job id
+
+        Returns:
+        --------
+        A JobStatus with the state, progress (between 0.0 and 1.0) and completion of the job.
+        """
+        status: osparc.JobStatus = self._solvers_api.inspect_job(
+            self._solver.id, self._solver.version, job_id
         )
-        self._jobs.append(job)
-        self._solvers_api.start_job(self._solver.id, self._solver.version, job.id)
-        return job.id
+        return JobStatus.from_osparc(job_id, status)
 
     def get_job_progress(self, job_id: str) -> float:
         """
@@ -74,10 +359,7 @@ class O2SparcSolver:
         --------
         A float between 0.0 and 1.0 indicating the progress of the job. 1.0 means the job is done.
         """
-        status: osparc.JobStatus = self._solvers_api.inspect_job(
-            self._solver.id, self._solver.version, job_id
-        )
-        return float(status.progress / 100)
+        return self.get_job_status(job_id).progress
 
     def job_done(self, job_id: str) -> bool:
         """
@@ -92,12 +374,117 @@ class O2SparcSolver:
         --------
         A bool which is True if and only if the job is done
         """
-        status: osparc.JobStatus = self._solvers_api.inspect_job(
-            self._solver.id, self._solver.version, job_id
-        )
-        return not (status.stopped_at is None)
+        return self.get_job_status(job_id).done
+
+    def wait_for_jobs(
+        self,
+        job_ids: list[str],
+        timeout: float | None = None,
+        on_progress: Callable[[JobStatus], None] | None = None,
+        return_when: str = ALL_COMPLETED,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        max_workers: int = 8,
+    ) -> dict[str, JobStatus]:
+        """
+        Wait for jobs to complete
+
+        The unfinished jobs are polled concurrently. The interval between the polls is doubled
+        (up to max_interval) while none of the jobs changes and reset to min_interval otherwise.
+
+        Parameters:
+        -----------
+        job_ids: List[str]
+            The job ids
+        timeout: float
+            Max number of seconds to wait, unlimited if None.
+        on_progress: Callable[[JobStatus], None]
+            A function called with the status of a job whenever it changes.
+        return_when: str
+            concurrent.futures.ALL_COMPLETED or FIRST_COMPLETED to return
+            when any of the jobs is done.
+        min_interval: float
+            The initial interval between the polls in seconds.
+        max_interval: float
+            The max interval between the polls in seconds.
+        max_workers: int
+            Max number of jobs polled concurrently.
 
-    def get_results(self, job_id: str) -> dict[str, Any]:
+        Returns:
+        --------
+        A dictionary with the last status of each job. Some of the jobs are not done
+        if the timeout expired or return_when is FIRST_COMPLETED.
+        """
+        if return_when not in (ALL_COMPLETED, FIRST_COMPLETED):
+            raise ValueError(f"Unsupported return_when: {return_when}")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        statuses: dict[str, JobStatus] = {}
+        interval = min_interval
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                pending = [
+                    job_id
+                    for job_id in job_ids
+                    if job_id not in statuses or not statuses[job_id].done
+                ]
+                changed = False
+                for status in executor.map(self.get_job_status, pending):
+                    if status != statuses.get(status.job_id):
+                        changed = True
+                        statuses[status.job_id] = status
+                        if on_progress is not None:
+                            on_progress(status)
+
+                done = [status.done for status in statuses.values()]
+                if all(done) or (return_when == FIRST_COMPLETED and any(done)):
+                    break
+
+                interval = min_interval if changed else min(interval * 2, max_interval)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    interval = min(interval, remaining)
+                time.sleep(interval)
+
+        return {job_id: statuses[job_id] for job_id in job_ids}
+
+    def _download_file(self, file: osparc.File, dest_dir: Path | None = None) -> Path:
+        """
+        Downloads an output file into dest_dir (or a new temporary directory if None).
+
+        The file is streamed to disk in chunks into a temporary (.part) file,
+        which is renamed once completed.
+        """
+        if dest_dir is None:
+            # a directory of its own, so that outputs with the same filename do not collide
+            dest_dir = Path(mkdtemp())
+
+        output_path: Path = dest_dir / Path(file.filename).name
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path: Path = output_path.with_name(output_path.name + ".part")
+        response = self._files_api.download_file(file_id=file.id, _preload_content=False)
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in response.stream(self.download_chunk_size):
+                    f.write(chunk)
+            os.replace(part_path, output_path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+        finally:
+            response.release_conn()
+        return output_path
+
+    def get_results(
+        self,
+        job_id: str,
+        dest_dir: str | Path | None = None,
+        skip_status_check: bool = False,
+        lazy: bool = False,
+        max_workers: int = 4,
+    ) -> dict[str, Any]:
         """
         Get the results from a job
 
@@ -105,26 +492,130 @@ class O2SparcSolver:
         -----------
         job_id: str
             The job id
+        dest_dir: str | pathlib.Path
+            The directory where the output files are stored as <dest_dir>/<output>/<filename>,
+            each file is downloaded into a new temporary directory if None.
+        skip_status_check: bool
+            Determines if the check that the job is done should be skipped,
+            e.g. if already known from wait_for_jobs.
+        lazy: bool
+            Determines if the output files are returned as LazyFile handles,
+            downloaded only when accessed.
+        max_workers: int
+            Max number of output files downloaded concurrently.
 
         Returns:
         --------
         A dictionary containing the results.
         """
-        if not self.job_done(job_id):
+        if not skip_status_check and not self.job_done(job_id):
             raise RuntimeError(f"The job with job_id={job_id} is not done yet.")
         outputs: osparc.JobOutputs = self._solvers_api.get_job_outputs(
             self._solver.id, self._solver.version, job_id
         )
+
+        def download(key: str) -> Callable[[osparc.File], Path]:
+            output_dir = None if dest_dir is None else Path(dest_dir) / key
+            return lambda file: self._download_file(file, output_dir)
+
         results: dict[str, Any] = {}
+        files: dict[str, osparc.File] = {}
         for key in outputs.results:
             r = outputs.results[key]
             if isinstance(r, osparc.File):
-                download_path: str = self._files_api.download_file(file_id=r.id)
-                results[key] = Path(download_path)
+                files[key] = r
+                results[key] = LazyFile(r, download(key))
             else:
                 results[key] = r
+
+        if not lazy and files:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                paths = executor.map(lambda key: results[key].path, files)
+                results.update(zip(files, paths))
         return results
 
+    async def asubmit_job(self, job_inputs: dict[str, str | int | float | Path]) -> str:
+        """
+        Submit a job to the solver/computational service without blocking the event loop.
+
+        See also
+        --------
+        submit_job()
+        """
+        return await self._run_async(self.submit_job, job_inputs)
+
+    async def aget_job_status(self, job_id: str) -> JobStatus:
+        """
+        Get the job status without blocking the event loop.
+
+        See also
+        --------
+        get_job_status()
+        """
+        return await self._run_async(self.get_job_status, job_id)
+
+    async def aget_job_progress(self, job_id: str) -> float:
+        """
+        Get the job progress without blocking the event loop.
+
+        See also
+        --------
+        get_job_progress()
+        """
+        return (await self.aget_job_status(job_id)).progress
+
+    async def aget_results(self, job_id: str, **kwargs) -> dict[str, Any]:
+        """
+        Get the results from a job without blocking the event loop.
+
+        See also
+        --------
+        get_results()
+        """
+        return await self._run_async(lambda: self.get_results(job_id, **kwargs))
+
+    async def astream_job_status(
+        self, job_id: str, min_interval: float = 1.0, max_interval: float = 30.0
+    ) -> AsyncIterator[JobStatus]:
+        """
+        Stream the status of a job until it is done
+
+        The interval between the polls is doubled (up to max_interval) while the status
+        does not change and reset to min_interval otherwise. No thread is used while waiting,
+        so that a single event loop could follow many jobs.
+
+        Parameters:
+        -----------
+        job_id: str
+            The job id
+        min_interval: float
+            The initial interval between the polls in seconds.
+        max_interval: float
+            The max interval between the polls in seconds.
+
+        Returns:
+        --------
+        An async iterator over the changed statuses of the job, the last of them is done.
+
+        Example:
+        --------
+        async for status in solver.astream_job_status(job_id):
+            print(status.progress)
+        """
+        previous: JobStatus | None = None
+        interval = min_interval
+        while True:
+            status = await self.aget_job_status(job_id)
+            if status != previous:
+                yield status
+                previous = status
+                interval = min_interval
+            else:
+                interval = min(interval * 2, max_interval)
+            if status.done:
+                return
+            await asyncio.sleep(interval)
+
     def get_job_log(self, job_id: str) -> TemporaryDirectory:
         """
         Get the logs from a job
@@ -152,7 +643,13 @@ class O2SparcSolver:
 
 
 class O2SparcService(ServiceBase):
-    """Wraps osparc python client library and fulfills ServiceBase interface"""
+    """Wraps osparc python client library and fulfills ServiceBase interface
+
+    The input files uploaded by the solvers could be tracked in a SQLite database
+    (o2sparc_upload_cache_path), so that unchanged files are reused across sessions.
+    The blocking calls of the async functions (e.g. aget_solver) are run by an executor
+    shared by the solvers, with at most o2sparc_max_workers (16 by default) threads.
+    """
 
     def __init__(self, config: dict[str, Any] | SectionProxy | None = None, connect: bool = True) -> None:
         config = config or {}
@@ -176,6 +673,21 @@ class O2SparcService(ServiceBase):
 
         self._client = osparc.ApiClient(configuration=configuration)
 
+        # a store of the uploaded input files, shared by the solvers
+        self._upload_cache: ResponseCache | None = None
+        upload_cache_path = config.get("o2sparc_upload_cache_path")
+        if upload_cache_path is not None:
+            self._upload_cache = SqliteResponseCache(
+                upload_cache_path,
+                max_size=int(config.get("o2sparc_upload_cache_size", 1024)),
+                ttl=float(config.get("o2sparc_upload_cache_ttl", 30 * 24 * 3600)),
+            )
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(config.get("o2sparc_max_workers", O2SparcSolver.max_workers)),
+            thread_name_prefix="o2sparc",
+        )
+
         if connect:
             self.connect()
 
@@ -221,6 +733,7 @@ class O2SparcService(ServiceBase):
 
     def close(self) -> None:
         """Closes the osparc client."""
+        self._executor.shutdown()
         self._client.close()
 
     def get_solver(self, solver_key: str, solver_version: str) -> O2SparcSolver:
@@ -237,4 +750,18 @@ class O2SparcService(ServiceBase):
         --------
         A O2SparcSolver object, to which jobs can be submitted
         """
-        return O2SparcSolver(self._client, solver_key, solver_version)
+        return O2SparcSolver(
+            self._client, solver_key, solver_version, self._upload_cache, self._executor
+        )
+
+    async def aget_solver(self, solver_key: str, solver_version: str) -> O2SparcSolver:
+        """Get a computational service (solver) without blocking the event loop.
+
+        See also
+        --------
+        get_solver()
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self.get_solver, solver_key, solver_version
+        )
@@ -1,12 +1,27 @@
 from __future__ import annotations
 
+import copy
+import hashlib
+import json
 import logging
+import os
+import re
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import urlsplit
 
 import requests
 from pennsieve2 import Pennsieve
+from requests.adapters import HTTPAdapter, Retry
 from configparser import SectionProxy
-from typing import List, Optional, Union
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple, Union
+from ._cache import FileCache, ResponseCache, SqliteResponseCache
 from ._default import ServiceBase
+from ._manifest import FileManifest
+from ._ratelimit import RateLimiter
+from ._zipstream import iter_zip_entries
 
 
 class PennsieveService(ServiceBase):
@@ -16,6 +31,15 @@ class PennsieveService(ServiceBase):
     -----------
     config : dict
         A configuration with defined profile name (pennsieve_profile_name).
+        Optionally, the directory (pennsieve_cache_dir) and max size in bytes
+        (pennsieve_cache_size) of the local cache of the downloaded files,
+        the address of the API (pennsieve_host_api), the size of the HTTP connection
+        pool (pennsieve_pool_size), the timeout of HTTP requests in seconds
+        (pennsieve_timeout), the max number of requests per second sent to a host by
+        get_many() (pennsieve_rate_limit) and the settings of the store of response
+        validators (pennsieve_validator_cache_size, pennsieve_validator_cache_path).
+        The store is enabled if any of them is defined and shared between processes
+        if pennsieve_validator_cache_path is defined.
     connect : bool
         Determines if Sparc Client should initiate connection with Pennsieve Agent.
 
@@ -25,8 +49,19 @@ class PennsieveService(ServiceBase):
         A dictionary with headers to make HTTP requests.
     host_api : str
         A default HTTP address of the Pennsieve.
+    pool_size : int
+        Max number of connections kept open by the HTTP session.
+    timeout : tuple
+        Timeouts (in seconds) of connecting to and reading from the server.
+    rate_limit : float
+        Max number of requests per second sent to a host by get_many(), unlimited if None.
     Pennsieve : object
         A class holding st.
+    file_cache : FileCache
+        An optional cache of the downloaded files, disabled (None) by default.
+    validator_cache : ResponseCache
+        An optional store of the responses with their ETag and Last-Modified validators,
+        used to send conditional GET requests, disabled (None) by default.
 
 
     Methods:
@@ -49,6 +84,23 @@ class PennsieveService(ServiceBase):
         Returns a dictionary with filenames stored at AWS matching search criteria.
     list_records(...) : dict
         Returns a dictionary with records matching search criteria.
+    iter_datasets(...), iter_files(...), iter_records(...) : Iterator[dict]
+        Iterates over all the datasets, files or records matching search criteria,
+        fetching the pages concurrently.
+    sync_catalog(...) : list
+        Returns the datasets published or updated since the previous sync.
+    build_manifest(...) : FileManifest
+        Returns a local index of the files of a dataset, which could be queried offline.
+    download_file(...) : Response
+        Downloads files from a single dataset into a local file (or extracts them on the fly).
+    iter_archive(...) : Iterator[tuple]
+        Iterates over (path, file-like object) pairs of files downloaded from a single dataset.
+    download_files(...) : list
+        Downloads files from any datasets concurrently into a local directory tree.
+    get(...), post(...), put(...), delete(...) : dict
+        Invokes an endpoint on a server.
+    get_many(...) : list
+        Invokes GET endpoints concurrently, with per-host rate limiting.
 
     """
 
@@ -58,8 +110,15 @@ class PennsieveService(ServiceBase):
     }
 
     host_api = "https://api.pennsieve.io"
+    download_chunk_size = 1024 * 1024
+    pool_size: int = 10
+    timeout: tuple = (10, 300)
+    rate_limit: float = None
     Pennsieve: Pennsieve = None
     profile_name: str = None
+    file_cache: FileCache = None
+    validator_cache: ResponseCache = None
+    validator_ttl: float = 30 * 24 * 3600
 
     def __init__(
         self, config: Optional[Union[dict, SectionProxy]] = None, connect: bool = False
@@ -71,11 +130,101 @@ class PennsieveService(ServiceBase):
         if config is not None:
             self.profile_name = config.get("pennsieve_profile_name")
             logging.info("Profile: " + self.profile_name)
+            self.host_api = config.get("pennsieve_host_api", self.host_api).rstrip("/")
+            self.pool_size = int(config.get("pennsieve_pool_size", self.pool_size))
+            if config.get("pennsieve_rate_limit") is not None:
+                self.rate_limit = float(config.get("pennsieve_rate_limit"))
+            if config.get("pennsieve_timeout") is not None:
+                timeout = float(config.get("pennsieve_timeout"))
+                self.timeout = (min(timeout, self.timeout[0]), timeout)
+            if config.get("pennsieve_validator_cache_path") is not None:
+                self.validator_cache = SqliteResponseCache(
+                    config.get("pennsieve_validator_cache_path"),
+                    max_size=int(config.get("pennsieve_validator_cache_size", 1024)),
+                    ttl=self.validator_ttl,
+                )
+            elif config.get("pennsieve_validator_cache_size") is not None:
+                self.validator_cache = ResponseCache(
+                    max_size=int(config.get("pennsieve_validator_cache_size")),
+                    ttl=self.validator_ttl,
+                )
+            if config.get("pennsieve_cache_dir") is not None:
+                self.file_cache = FileCache(
+                    config.get("pennsieve_cache_dir"),
+                    int(config.get("pennsieve_cache_size", 1024**3)),
+                )
         else:
             logging.info("Profile: none")
+        self._session = self._create_session()
         if connect:
             self.connect()  # profile_name=self.profile_name)
 
+    def _create_session(self) -> requests.Session:
+        """Returns a session with a pool of connections shared by the raw HTTP requests."""
+        session = requests.Session()
+        # zipit and presigned downloads are idempotent, so that POST requests are retried too
+        retries = Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=retries,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _auth_headers(self) -> dict:
+        """Returns the default headers with the authorization of the connected session."""
+        headers = dict(self.Pennsieve.http_api._get_default_headers())
+        headers.update(self.default_headers)
+        return headers
+
+    def _get(self, url: str, params: dict = None) -> Optional[dict]:
+        """Sends a GET request to a discover endpoint and returns the decoded response.
+
+        If validator_cache is enabled, the request is conditional (with If-None-Match
+        or If-Modified-Since headers) and the stored response is returned on 304.
+        """
+        if self.validator_cache is None:
+            return self.Pennsieve.get(url, headers=self.default_headers, params=params)
+
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        key = self.validator_cache.key(url, params)
+        cached = self.validator_cache.get(key)
+        headers = self._auth_headers()
+        if cached is not None and cached.get("etag") is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached is not None and cached.get("last_modified") is not None:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response = self._session.get(url, headers=headers, params=params, timeout=self.timeout)
+            if response.status_code == 304 and cached is not None:
+                logging.info("Not modified: " + response.url)
+                # the stored response must not be changed by the caller
+                return copy.deepcopy(cached["body"])
+            response.raise_for_status()
+            body = response.json()
+        except requests.HTTPError as e:
+            logging.error(f"HTTP error occurred: {e}")
+            return None
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Request failed: {e}")
+            return None
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag is not None or last_modified is not None:
+            self.validator_cache.set(
+                key, {"etag": etag, "last_modified": last_modified, "body": copy.deepcopy(body)}
+            )
+        return body
+
     def connect(self) -> Pennsieve:
         """Establishes connection with Pennsieve Agent."""
         logging.info("Connecting to Pennsieve...")
@@ -114,7 +263,8 @@ class PennsieveService(ServiceBase):
         return self.Pennsieve.switch(profile_name)
 
     def close(self) -> None:
-        """Closes the Pennsieve Agent."""
+        """Closes the Pennsieve Agent and the HTTP session."""
+        self._session.close()
         return self.Pennsieve.stop()
 
     def list_datasets(
@@ -163,9 +313,8 @@ class PennsieveService(ServiceBase):
         A json with the results.
 
         """
-        return self.Pennsieve.get(
+        return self._get(
             self.host_api + "/discover/search/datasets",
-            headers=self.default_headers,
             params={
                 "limit": limit,
                 "offset": offset,
@@ -214,9 +363,8 @@ class PennsieveService(ServiceBase):
         List of files stored at AWS with their parameters.
         """
 
-        return self.Pennsieve.get(
+        return self._get(
             self.host_api + "/discover/search/files",
-            headers=self.default_headers,
             params={
                 "limit": limit,
                 "offset": offset,
@@ -278,9 +426,8 @@ class PennsieveService(ServiceBase):
             Files within this dataset.
         """
 
-        return self.Pennsieve.get(
+        return self._get(
             self.host_api + "/discover/search/records",
-            headers=self.default_headers,
             params={
                 "limit": limit,
                 "offset": offset,
@@ -290,21 +437,527 @@ class PennsieveService(ServiceBase):
             },
         )
 
-    def download_file(self, file_list: list[dict] | dict, output_name: str = None):
-        """Downloads files into a local storage.
+    def _iter_pages(
+        self,
+        endpoint: str,
+        key: str,
+        params: dict,
+        page_size: int = 100,
+        max_items: int = None,
+        max_workers: int = 4,
+    ) -> Iterator[dict]:
+        """Iterates over the items of all the pages returned by a discover search endpoint.
+
+        The first page is used to read the total count of the items, the remaining pages are
+        fetched concurrently, at most max_workers pages ahead of the consumer.
+        """
+        url = self.host_api + endpoint
+        limit = page_size if max_items is None else min(page_size, max_items)
+
+        def get_page(offset: int) -> dict:
+            page_params = dict(params, limit=limit, offset=offset)
+            page = self._get(url, params=page_params)
+            if page is None:
+                raise RuntimeError(f"Failed to get the page of {endpoint} at offset {offset}")
+            return page
+
+        first_page = get_page(0)
+        total = first_page["totalCount"]
+        if max_items is not None:
+            total = min(total, max_items)
+        yield from first_page[key][:total]
+
+        offsets = iter(range(page_size, total, page_size))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages = deque(
+                (offset, executor.submit(get_page, offset))
+                for offset in islice(offsets, max_workers)
+            )
+            try:
+                while pages:
+                    offset, page = pages.popleft()
+                    # keep max_workers pages fetched ahead of the consumer
+                    for next_offset in islice(offsets, 1):
+                        pages.append((next_offset, executor.submit(get_page, next_offset)))
+                    yield from page.result()[key][: total - offset]
+            finally:
+                for _, page in pages:
+                    page.cancel()
+
+    def iter_datasets(
+        self,
+        page_size: int = 100,
+        max_items: int = None,
+        max_workers: int = 4,
+        query: str = None,
+        organization: str = None,
+        organization_id: int = None,
+        tags: List[str] = None,
+        embargo: bool = None,
+        order_by: str = None,
+        order_direction: str = None,
+    ) -> Iterator[dict]:
+        """Iterates over all datasets matching specified criteria.
+
+        The total number of datasets is read from the first page, then the remaining pages
+        are fetched concurrently and the datasets are returned in order.
 
         Parameters:
         -----------
-        file_list : list[dict] or dict
-            Names of the file(s) to download with their parameters.
-            The files need to come from a single database.
-        output_name : str
-            The name of the output file.
+        page_size : int
+            Number of datasets fetched with a single request.
+        max_items : int
+            Max number of datasets returned, all of them if None.
+        max_workers : int
+            Max number of pages fetched concurrently.
+
+        The remaining parameters are the same as in list_datasets().
 
         Returns:
         --------
-        A response from the server.
+        An iterator over the datasets.
+
         """
+        return self._iter_pages(
+            "/discover/search/datasets",
+            "datasets",
+            {
+                "query": query,
+                "organization": organization,
+                "organizationId": organization_id,
+                "tags": tags,
+                "embargo": embargo,
+                "orderBy": order_by,
+                "orderDirection": order_direction,
+            },
+            page_size,
+            max_items,
+            max_workers,
+        )
+
+    def iter_files(
+        self,
+        page_size: int = 100,
+        max_items: int = None,
+        max_workers: int = 4,
+        file_type: str = None,
+        query: str = None,
+        organization: str = None,
+        organization_id: int = None,
+        dataset_id: int = None,
+    ) -> Iterator[dict]:
+        """Iterates over all files matching specified criteria.
+
+        Parameters:
+        -----------
+        page_size : int
+            Number of files fetched with a single request.
+        max_items : int
+            Max number of files returned, all of them if None.
+        max_workers : int
+            Max number of pages fetched concurrently.
+
+        The remaining parameters are the same as in list_files().
+
+        Returns:
+        --------
+        An iterator over the files stored at AWS with their parameters.
+
+        See also
+        --------
+        iter_datasets()
+        """
+        return self._iter_pages(
+            "/discover/search/files",
+            "files",
+            {
+                "fileType": file_type,
+                "query": query,
+                "organization": organization,
+                "organizationId": organization_id,
+                "datasetId": dataset_id,
+            },
+            page_size,
+            max_items,
+            max_workers,
+        )
+
+    def iter_records(
+        self,
+        page_size: int = 100,
+        max_items: int = None,
+        max_workers: int = 4,
+        model: str = None,
+        organization: str = None,
+        dataset_id: int = None,
+    ) -> Iterator[dict]:
+        """Iterates over all records matching specified criteria.
+
+        Parameters:
+        -----------
+        page_size : int
+            Number of records fetched with a single request.
+        max_items : int
+            Max number of records returned, all of them if None.
+        max_workers : int
+            Max number of pages fetched concurrently.
+
+        The remaining parameters are the same as in list_records().
+
+        Returns:
+        --------
+        An iterator over the records.
+
+        See also
+        --------
+        iter_datasets()
+        """
+        return self._iter_pages(
+            "/discover/search/records",
+            "records",
+            {
+                "model": model,
+                "organization": organization,
+                "datasetId": dataset_id,
+            },
+            page_size,
+            max_items,
+            max_workers,
+        )
+
+    def sync_catalog(
+        self, state_path: str, page_size: int = 100, max_workers: int = 2
+    ) -> List[dict]:
+        """Returns the datasets whose versions changed since the previous sync.
+
+        The datasets are listed from the most recently published ones and the listing stops
+        at the watermark (the latest publication date seen by the previous sync), so that
+        only the changes are fetched. The watermark and the versions of the datasets are
+        persisted in a JSON file.
+
+        Parameters:
+        -----------
+        state_path : str
+            The location of the state of the sync, created if it does not exist.
+        page_size : int
+            Number of datasets fetched with a single request.
+        max_workers : int
+            Max number of pages fetched concurrently.
+
+        Returns:
+        --------
+        A list of the new or updated datasets, all of them on the first sync.
+        """
+        state = {"watermark": None, "versions": {}}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                state = json.load(f)
+        watermark = state["watermark"]
+        versions = state["versions"]
+
+        changed = []
+        latest = watermark
+        datasets = self.iter_datasets(
+            page_size=page_size,
+            max_workers=max_workers,
+            order_by="date",
+            order_direction="desc",
+        )
+        for dataset in datasets:
+            published = dataset.get("versionPublishedAt") or dataset.get("updatedAt")
+            if watermark is not None and published is not None and published < watermark:
+                datasets.close()
+                break
+            if versions.get(str(dataset["id"])) != dataset["version"]:
+                versions[str(dataset["id"])] = dataset["version"]
+                changed.append(dataset)
+            if published is not None and (latest is None or published > latest):
+                latest = published
+
+        # replace the state at once, so that it is never left incomplete
+        part_name = state_path + ".part"
+        with open(part_name, "w") as f:
+            json.dump({"watermark": latest, "versions": versions}, f)
+        os.replace(part_name, state_path)
+        logging.info(f"Synced {len(changed)} datasets, watermark: {latest}")
+        return changed
+
+    def build_manifest(
+        self,
+        dataset_id: int,
+        version: int = None,
+        path: str = ":memory:",
+        refresh: bool = False,
+        page_size: int = 1000,
+        max_workers: int = 4,
+    ) -> FileManifest:
+        """Lists all the files of a dataset once and stores them in a local index.
+
+        Parameters:
+        -----------
+        dataset_id : int
+            The id of the dataset.
+        version : int
+            The version of the dataset, the latest one if None. Only the versions indexed
+            by the /discover/search/files endpoint, usually just the latest one, are
+            supported. RuntimeError is raised if none of the files is of the version.
+        path : str
+            The location of the SQLite database with the index, kept in memory by default.
+        refresh : bool
+            Determines if the files should be listed again, even if already stored at path.
+        page_size : int
+            Number of files fetched with a single request.
+        max_workers : int
+            Max number of pages fetched concurrently.
+
+        Returns:
+        --------
+        A FileManifest, which filters the files by path glob, file type and size locally.
+        """
+        if version is None:
+            dataset = self._get(self.host_api + f"/discover/datasets/{dataset_id}")
+            if dataset is None:
+                raise RuntimeError(f"Unable to find the dataset {dataset_id}")
+            version = dataset["version"]
+
+        manifest = FileManifest(dataset_id, version, path)
+        if refresh or len(manifest) == 0:
+            manifest.clear()
+            files = self.iter_files(
+                page_size=page_size, max_workers=max_workers, dataset_id=dataset_id
+            )
+            versions = set()
+
+            def of_version(files: Iterator[dict]) -> Iterator[dict]:
+                for file in files:
+                    versions.add(file.get("datasetVersion"))
+                    if file.get("datasetVersion") == version:
+                        yield file
+
+            count = manifest.add(of_version(files))
+            if count == 0 and versions:
+                raise RuntimeError(
+                    f"No files of the dataset {dataset_id} version {version} are indexed, "
+                    f"only of the versions {sorted(v for v in versions if v is not None)}"
+                )
+            if count == 0:
+                logging.warning(f"No files of the dataset {dataset_id} are indexed")
+            logging.info(f"Stored {count} files of the dataset {dataset_id} version {version}")
+        return manifest
+
+    def _write_response(
+        self,
+        response: requests.Response,
+        output_name: str,
+        chunk_size: int = None,
+        progress: Callable[[int, Optional[int]], None] = None,
+        offset: int = 0,
+        keep_partial: bool = False,
+    ) -> str:
+        """Streams the body of a response into a file.
+
+        The body is written in chunks into a temporary (.part) file, which is renamed into
+        output_name once completed. If offset is given, the body is appended to the first
+        offset bytes of an existing .part file. If keep_partial is True, the .part file is
+        not removed on failure. Returns the SHA-256 checksum of the whole file.
+        """
+        chunk_size = chunk_size or self.download_chunk_size
+        total = response.headers.get("content-length")
+        total = offset + int(total) if total is not None else None
+        checksum = hashlib.sha256()
+        written = offset
+
+        part_name = output_name + ".part"
+        try:
+            with open(part_name, mode="r+b" if offset else "wb") as f:
+                # include the bytes downloaded before in the checksum
+                while f.tell() < offset:
+                    checksum.update(f.read(min(chunk_size, offset - f.tell())))
+                f.truncate(offset)
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    checksum.update(chunk)
+                    written += len(chunk)
+                    if progress is not None:
+                        progress(written, total)
+            os.replace(part_name, output_name)
+        except BaseException:
+            if not keep_partial and os.path.exists(part_name):
+                os.remove(part_name)
+            raise
+        return checksum.hexdigest()
+
+    def _extract_response(
+        self,
+        response: requests.Response,
+        extract_dir: str,
+        chunk_size: int = None,
+        progress: Callable[[int, Optional[int]], None] = None,
+    ) -> Tuple[str, List[str]]:
+        """Extracts the files from a zip archive streamed in the body of a response.
+
+        The archive is never stored, each file is written into a temporary (.part) file,
+        which is renamed once completed. Returns the SHA-256 checksum of the archive
+        and the list of the extracted files.
+        """
+        chunk_size = chunk_size or self.download_chunk_size
+        total = response.headers.get("content-length")
+        total = int(total) if total is not None else None
+        checksum = hashlib.sha256()
+        extract_dir = os.path.abspath(extract_dir)
+        read = 0
+
+        def iter_chunks() -> Iterator[bytes]:
+            nonlocal read
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                checksum.update(chunk)
+                read += len(chunk)
+                if progress is not None:
+                    progress(read, total)
+                yield chunk
+
+        chunks = iter_chunks()
+        files = []
+        for name, entry in iter_zip_entries(chunks):
+            output_name = os.path.abspath(os.path.join(extract_dir, name))
+            if not output_name.startswith(extract_dir + os.sep):
+                raise ValueError(f"The path of the file is outside of {extract_dir}: {name}")
+            if name.endswith("/"):
+                os.makedirs(output_name, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(output_name), exist_ok=True)
+            part_name = output_name + ".part"
+            try:
+                with open(part_name, mode="wb") as f:
+                    shutil.copyfileobj(entry, f, chunk_size)
+                os.replace(part_name, output_name)
+            except BaseException:
+                if os.path.exists(part_name):
+                    os.remove(part_name)
+                raise
+            files.append(output_name)
+
+        # include the central directory in the checksum
+        for _ in chunks:
+            pass
+        return checksum.hexdigest(), files
+
+    def _read_cache(self, key: tuple, output_name: str) -> Optional[requests.Response]:
+        """Copies a file from the cache into output_name.
+
+        Returns a response with status code 200 (and from_cache attribute set to True)
+        or None if the file is not cached.
+        """
+        if self.file_cache is None:
+            return None
+        cached_name = self.file_cache.get(key)
+        if cached_name is None:
+            return None
+
+        checksum = hashlib.sha256()
+        part_name = output_name + ".part"
+        try:
+            with open(cached_name, mode="rb") as src, open(part_name, mode="wb") as dst:
+                for chunk in iter(lambda: src.read(self.download_chunk_size), b""):
+                    dst.write(chunk)
+                    checksum.update(chunk)
+            os.replace(part_name, output_name)
+        except FileNotFoundError:
+            # the file was evicted in the meantime
+            if os.path.exists(part_name):
+                os.remove(part_name)
+            return None
+        logging.info(f"Copied {output_name} from the cache")
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = cached_name
+        response.checksum = checksum.hexdigest()
+        response.from_cache = True
+        return response
+
+    def _write_cache(self, key: tuple, response: requests.Response, output_name: str) -> None:
+        """Stores a downloaded file in the cache."""
+        if self.file_cache is not None and response.status_code in (200, 206):
+            self.file_cache.put(key, output_name)
+
+    @staticmethod
+    def _content_range_start(response: requests.Response) -> Optional[int]:
+        """Returns the first byte position of Content-Range (bytes START-END/TOTAL)."""
+        match = re.match(r"bytes (\d+)-", response.headers.get("content-range", ""))
+        return None if match is None else int(match.group(1))
+
+    def _download_resumable(
+        self,
+        url: str,
+        body: dict,
+        headers: dict,
+        output_name: str,
+        chunk_size: int = None,
+        progress: Callable[[int, Optional[int]], None] = None,
+    ) -> requests.Response:
+        """Downloads a file, resuming a previously interrupted download if possible.
+
+        The request and the validators (ETag, Last-Modified) of the response are recorded in
+        a sidecar (.part.json) file next to the .part file. If both of them exist and match
+        the request, the download is resumed with a Range request. If the server does not
+        support range requests or returns another range, the download restarts from the
+        beginning. A failed request raises requests.HTTPError before anything is written.
+        """
+        part_name = output_name + ".part"
+        sidecar_name = part_name + ".json"
+
+        state = {}
+        if os.path.exists(part_name) and os.path.exists(sidecar_name):
+            with open(sidecar_name) as f:
+                state = json.load(f)
+        offset = os.path.getsize(part_name) if state.get("request") == body else 0
+
+        request_headers = dict(headers)
+        if offset:
+            request_headers["Range"] = f"bytes={offset}-"
+            validator = state.get("etag") or state.get("last_modified")
+            if validator is not None:
+                request_headers["If-Range"] = validator
+        response = self._session.post(
+            url, json=body, headers=request_headers, stream=True, timeout=self.timeout
+        )
+
+        if (offset and response.status_code == 416) or (
+            response.status_code == 206 and self._content_range_start(response) != offset
+        ):
+            # the range is not valid any more (e.g. the file has changed)
+            # or the server sent another range than requested
+            response.close()
+            response = self._session.post(
+                url, json=body, headers=headers, stream=True, timeout=self.timeout
+            )
+        if not response.ok:
+            # keep the partial download for the next attempt
+            with response:
+                response.raise_for_status()
+        if response.status_code != 206:
+            offset = 0
+        logging.info(f"Downloading {output_name} from byte {offset}")
+
+        with open(sidecar_name, mode="w") as f:
+            json.dump(
+                {
+                    "request": body,
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                },
+                f,
+            )
+        with response:
+            response.checksum = self._write_response(
+                response, output_name, chunk_size, progress, offset, keep_partial=True
+            )
+        os.remove(sidecar_name)
+        return response
+
+    def _zipit_request(self, file_list: list[dict] | dict) -> Tuple[tuple, list, dict]:
+        """Returns (datasetId, version) of the files, their paths and a body of zipit request."""
 
         # make sure we are passing a list
         file_list = [file_list] if isinstance(file_list, dict) else file_list
@@ -328,20 +981,246 @@ class PennsieveService(ServiceBase):
                 "version": next(iter(properties))[1],
             }
         }
+        return next(iter(properties)), paths, json
+
+    def download_file(
+        self,
+        file_list: list[dict] | dict,
+        output_name: str = None,
+        chunk_size: int = None,
+        progress: Callable[[int, Optional[int]], None] = None,
+        resume: bool = False,
+        extract_dir: str = None,
+    ):
+        """Downloads files into a local storage.
+
+        The files are streamed to disk in chunks, so that they are never kept in memory.
+
+        Parameters:
+        -----------
+        file_list : list[dict] or dict
+            Names of the file(s) to download with their parameters.
+            The files need to come from a single database.
+        output_name : str
+            The name of the output file.
+        chunk_size : int
+            Number of bytes written at once, download_chunk_size by default.
+        progress : callable
+            A function called after each chunk with the number of bytes downloaded so far
+            and the total number of bytes (or None if not known).
+        resume : bool
+            Determines if an interrupted download should be resumed with range requests.
+            The partially downloaded file is kept as <output_name>.part.
+        extract_dir : str
+            If given, the files are stored in this directory instead of output_name.
+            The archive of multiple files is extracted on the fly, without being stored,
+            requests.HTTPError is raised if it cannot be downloaded.
+
+        Returns:
+        --------
+        A response from the server, with an additional checksum attribute holding
+        the SHA-256 checksum of the downloaded file (or the archive) and, if extract_dir
+        is given, files attribute with the list of the stored files. If a single file
+        is downloaded and file_cache is enabled, the file could be served from the cache.
+        """
+
+        file_list = [file_list] if isinstance(file_list, dict) else file_list
+        dataset, paths, json = self._zipit_request(file_list)
 
         # download the files with zipit service
-        url = "https://api.pennsieve.io/zipit/discover"
+        url = self.host_api + "/zipit/discover"
         headers = {"content-type": "application/json"}
-        response = requests.post(url, json=json, headers=headers)
 
-        # replace extension of the file with '.gz' if downloading more than 1 file
-        if output_name is None:
+        if extract_dir is not None and len(paths) > 1:
+            if resume:
+                raise ValueError("Resuming the extraction of multiple files is not supported.")
+            response = self._session.post(
+                url, json=json, headers=headers, stream=True, timeout=self.timeout
+            )
+            with response:
+                # a failed request must not be taken for an empty archive
+                response.raise_for_status()
+                response.checksum, response.files = self._extract_response(
+                    response, extract_dir, chunk_size, progress
+                )
+            return response
+
+        # published files never change, so a single file could be served from the cache
+        cache_key = None
+        if len(paths) == 1:
+            path = paths[0] if isinstance(paths[0], str) else paths[0].get("name")
+            cache_key = (*dataset, path)
+
+        if extract_dir is not None:
+            output_name = os.path.abspath(os.path.join(extract_dir, path))
+            if not output_name.startswith(os.path.abspath(extract_dir) + os.sep):
+                raise ValueError(f"The path of the file is outside of {extract_dir}: {path}")
+            os.makedirs(os.path.dirname(output_name), exist_ok=True)
+        elif output_name is None:
+            # replace extension of the file with '.gz' if downloading more than 1 file
             output_name = file_list[0]["name"] if len(paths) == 1 else "download.gz"
 
-        with open(output_name, mode="wb+") as f:
-            f.write(response.content)
+        if cache_key is not None:
+            response = self._read_cache(cache_key, output_name)
+            if response is not None:
+                response.files = [output_name]
+                return response
+
+        if resume:
+            response = self._download_resumable(
+                url, json, headers, output_name, chunk_size, progress
+            )
+        else:
+            response = self._session.post(
+                url, json=json, headers=headers, stream=True, timeout=self.timeout
+            )
+            with response:
+                response.checksum = self._write_response(
+                    response, output_name, chunk_size, progress
+                )
+        response.files = [output_name]
+
+        if cache_key is not None:
+            self._write_cache(cache_key, response, output_name)
         return response
 
+    def iter_archive(
+        self, file_list: list[dict] | dict, chunk_size: int = None
+    ) -> Iterator[Tuple[str, BinaryIO]]:
+        """Iterates over the files downloaded from a single dataset, without storing them.
+
+        The files are read from the zipit response while it is being downloaded,
+        so each file has to be read before moving to the next one.
+
+        Parameters:
+        -----------
+        file_list : list[dict] or dict
+            Names of the file(s) to download with their parameters.
+            The files need to come from a single database.
+        chunk_size : int
+            Number of bytes downloaded at once, download_chunk_size by default.
+
+        Returns:
+        --------
+        An iterator over (path, file-like object) pairs.
+        """
+        _, paths, json = self._zipit_request(file_list)
+        response = self._session.post(
+            self.host_api + "/zipit/discover",
+            json=json,
+            headers={"content-type": "application/json"},
+            stream=True,
+            timeout=self.timeout,
+        )
+        with response:
+            response.raise_for_status()
+            if len(paths) == 1:
+                # a single file is not archived
+                path = paths[0] if isinstance(paths[0], str) else paths[0].get("name")
+                response.raw.decode_content = True
+                yield path, response.raw
+                return
+            yield from iter_zip_entries(
+                response.iter_content(chunk_size=chunk_size or self.download_chunk_size)
+            )
+
+    def _get_download_urls(self, dataset_id: int, version: int, paths: list[str]) -> dict:
+        """Returns presigned URLs of the files in a dataset, keyed by their paths.
+
+        Files without a presigned URL in the download manifest are omitted.
+        """
+        manifest = self.Pennsieve.post(
+            self.host_api
+            + f"/discover/datasets/{dataset_id}/versions/{version}/files/download-manifest",
+            json={"paths": paths},
+            headers=self.default_headers,
+        )
+        urls = {}
+        for entry in (manifest or {}).get("data", []):
+            path = entry.get("path")
+            if isinstance(path, list):
+                path = "/".join(path)
+            if path and entry.get("name") and path.split("/")[-1] != entry["name"]:
+                path = path + "/" + entry["name"]
+            if path and entry.get("url"):
+                urls[path] = entry["url"]
+        return urls
+
+    def download_files(
+        self,
+        file_list: list[dict] | dict,
+        dest_dir: str = ".",
+        workers: int = 4,
+        chunk_size: int = None,
+    ) -> list[str]:
+        """Downloads files from one or more datasets into a local directory tree.
+
+        The files are grouped by dataset and version, presigned URLs of each group are
+        requested with a single download manifest, then the files are downloaded
+        concurrently. Files without a presigned URL are downloaded one by one with
+        the zipit service. If file_cache is enabled, the cached files are copied instead.
+
+        Parameters:
+        -----------
+        file_list : list[dict] or dict
+            Names of the file(s) to download with their parameters (e.g. from list_files()).
+        dest_dir : str
+            The directory where the files are stored as <datasetId>/<datasetVersion>/<path>.
+        workers : int
+            Max number of files downloaded concurrently.
+        chunk_size : int
+            Number of bytes written at once, download_chunk_size by default.
+
+        Returns:
+        --------
+        A list with the locations of the downloaded files, in the order of file_list.
+        """
+        file_list = [file_list] if isinstance(file_list, dict) else file_list
+        dest_dir = os.path.abspath(dest_dir)
+
+        # group the paths of the files by datasetId and version of the dataset
+        downloads = []
+        groups = {}
+        for x in file_list:
+            path = x["name"] if x.get("uri") is None else "/".join(x["uri"].split("/")[5:])
+            output_name = os.path.abspath(
+                os.path.join(dest_dir, str(x["datasetId"]), str(x["datasetVersion"]), path)
+            )
+            if not output_name.startswith(dest_dir + os.sep):
+                raise ValueError(f"The path of the file is outside of {dest_dir}: {path}")
+            downloads.append((x["datasetId"], x["datasetVersion"], path, output_name))
+            groups.setdefault((x["datasetId"], x["datasetVersion"]), []).append(path)
+
+        def download(item: tuple) -> str:
+            dataset_id, version, path, output_name = item
+            os.makedirs(os.path.dirname(output_name), exist_ok=True)
+            if self._read_cache((dataset_id, version, path), output_name) is not None:
+                return output_name
+
+            url = urls[(dataset_id, version)].get(path)
+            if url is not None:
+                response = self._session.get(url, stream=True, timeout=self.timeout)
+            else:
+                response = self._session.post(
+                    self.host_api + "/zipit/discover",
+                    json={"data": {"paths": [path], "datasetId": dataset_id, "version": version}},
+                    headers={"content-type": "application/json"},
+                    stream=True,
+                    timeout=self.timeout,
+                )
+            with response:
+                response.raise_for_status()
+                self._write_response(response, output_name, chunk_size)
+            self._write_cache((dataset_id, version, path), response, output_name)
+            return output_name
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            manifests = executor.map(
+                lambda group: self._get_download_urls(group[0], group[1], groups[group]), groups
+            )
+            urls = dict(zip(groups, manifests))
+            return list(executor.map(download, downloads))
+
     def get(self, url: str, **kwargs):
         """Invokes GET endpoint on a server. Passing server name in url is optional.
 
@@ -365,6 +1244,56 @@ class PennsieveService(ServiceBase):
         """
         return self.Pennsieve.get(url, **kwargs)
 
+    def get_many(
+        self,
+        urls: List[Union[str, dict]],
+        max_workers: int = 4,
+        rate_limit: float = None,
+    ) -> list:
+        """Invokes GET endpoints concurrently.
+
+        Parameters:
+        -----------
+        urls : list[str or dict]
+            The addresses of the endpoints, or dictionaries with the address (url)
+            and additional arguments of requests.get() (e.g. {"url": ..., "params": {...}}).
+        max_workers : int
+            Max number of requests sent concurrently.
+        rate_limit : float
+            Max number of requests per second sent to a single host, rate_limit
+            attribute by default.
+
+        Returns:
+        --------
+        A list with responses from the server in the order of urls. If a request
+        failed (e.g. requests.HTTPError for a 4xx or 5xx status), the exception raised
+        is returned in its place.
+
+        Example:
+        --------
+        p.get_many([f"{p.host_api}/discover/datasets/{id}" for id in [1, 2, 3]])
+        """
+        limiter = RateLimiter(rate_limit or self.rate_limit)
+        # read once, so that the session is not refreshed by the workers concurrently
+        headers = self._auth_headers()
+
+        def get(url: Union[str, dict]):
+            try:
+                kwargs = {"url": url} if isinstance(url, str) else dict(url)
+                if not kwargs["url"].startswith("http"):
+                    kwargs["url"] = self.host_api + kwargs["url"]
+                kwargs["headers"] = dict(headers, **kwargs.get("headers", {}))
+                kwargs.setdefault("timeout", self.timeout)
+                limiter.acquire(urlsplit(kwargs["url"]).netloc)
+                response = self._session.get(**kwargs)
+                response.raise_for_status()
+                return response.json()
+            except Exception as e:
+                return e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(get, urls))
+
     def post(self, url: str, json: dict, **kwargs):
         """Invokes POST endpoint on a server. Passing server name in url is optional.
 
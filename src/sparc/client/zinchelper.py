@@ -25,6 +25,7 @@ from scaffoldmaker.annotation.stellate_terms import get_stellate_term
 from scaffoldmaker.annotation.stomach_terms import get_stomach_term
 from scaffoldmaker.utils.exportvtk import ExportVtk
 
+from sparc.client.services._cache import FileCache
 from sparc.client.services.pennsieve import PennsieveService
 
 
@@ -45,9 +46,13 @@ class ZincHelper:
         analyse: Analyses an MBF XML file for mapping suitability to a specified organ.
     """
 
-    def __init__(self):
+    def __init__(self, cache_dir=None, cache_size=1024**3):
         """
         Initializes the ZincHelper class.
+
+        Args:
+            cache_dir (str): The directory of a local cache of the downloaded files, disabled if None.
+            cache_size (int): The maximum total size of the cached files (in bytes).
         """
         self._allOrgan = {
             "bladder": get_bladder_term,
@@ -66,6 +71,8 @@ class ZincHelper:
         self._context = Context("sparcclient")
         self._region = self._context.getDefaultRegion()
         self._pennsieveService = PennsieveService(connect=False)
+        if cache_dir is not None:
+            self._pennsieveService.file_cache = FileCache(cache_dir, cache_size)
 
     def download_files(
         self,
@@ -1,5 +1,8 @@
 import json
 import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
 import pytest
 from pennsieve2 import Pennsieve
@@ -157,3 +160,64 @@ class MockPennsieve(Pennsieve):
 @pytest.fixture
 def mock_pennsieve():
     return MockPennsieve()
+
+
+class LocalServer(ThreadingHTTPServer):
+    """A local stand-in HTTP server.
+
+    Register a route by adding a function returning (status, headers, body) to routes,
+    e.g. server.routes[("GET", "/path")] = lambda request: (200, {}, b"content").
+    All the received requests are stored in requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        super().__init__(("127.0.0.1", 0), LocalRequestHandler)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class LocalRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.body = self.rfile.read(length) if length else b""
+        # the handler is reused by the following requests of a kept-alive connection
+        self.server.requests.append(
+            SimpleNamespace(
+                command=self.command, path=self.path, headers=self.headers, body=self.body
+            )
+        )
+
+        route = self.server.routes.get((self.command, self.path.split("?")[0]))
+        status, headers, body = (404, {}, b"") if route is None else route(self)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if not any(name.lower() == "content-length" for name in headers):
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    server = LocalServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -85,3 +85,62 @@ def test_module_connect(config_file, monkeypatch):
 
     sc.connect()
     assert mock_connect_results == sc.module_names
+
+
+# Test lazy loading of the modules
+def test_lazy_modules(config_file):
+    sc = SparcClient(config_file=config_file, connect=False, lazy=True)
+    assert "pennsieve" in sc.module_names
+    assert "pennsieve" not in vars(sc)
+
+    from sparc.client.services.pennsieve import PennsieveService
+
+    assert isinstance(sc.pennsieve, PennsieveService)
+    assert "pennsieve" in vars(sc)
+    assert sc.module_names.count("pennsieve") == 1
+
+    with pytest.raises(AttributeError):
+        sc.xyz
+
+
+# Test a module which failed to load is loaded again on the next access
+def test_lazy_modules_retry(config_file, monkeypatch):
+    import sparc.client.client
+
+    sc = SparcClient(config_file=config_file, connect=False, lazy=True)
+    load_service = sparc.client.client.load_service
+
+    def failing_load_service(path):
+        raise ModuleNotFoundError(path)
+
+    monkeypatch.setattr(sparc.client.client, "load_service", failing_load_service)
+    with pytest.raises(ModuleNotFoundError):
+        sc.pennsieve
+
+    monkeypatch.setattr(sparc.client.client, "load_service", load_service)
+    from sparc.client.services.pennsieve import PennsieveService
+
+    assert isinstance(sc.pennsieve, PennsieveService)
+
+
+# Test lazily added module is connected on first access
+def test_lazy_add_module_connect(config_file):
+    sc = SparcClient(config_file=config_file, connect=False, lazy=True)
+    sc.add_module("mock_service", config={"module_param": "value"}, connect=False, lazy=True)
+    assert "mock_service" in sc.module_names
+
+    sc.connect()
+    assert "mock_service" not in vars(sc)
+    assert sc.mock_service.connect_method_called is True
+
+
+# Test module added lazily and then eagerly is connected
+def test_lazy_then_eager_add_module(config_file):
+    sc = SparcClient(config_file=config_file, connect=False, lazy=True)
+    sc.add_module("mock_service", config={"module_param": "value"}, connect=False, lazy=True)
+    sc.add_module("mock_service", config={"module_param": "value"}, connect=False)
+    assert "mock_service" in vars(sc)
+    assert sc.module_names.count("mock_service") == 1
+
+    sc.connect()
+    assert sc.mock_service.connect_method_called is True
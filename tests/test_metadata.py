@@ -1,7 +1,13 @@
+import asyncio
 import json
 import os
 
+import pytest
+import responses
+
 from sparc.client import SparcClient
+from sparc.client.services._streaming import iter_json_items
+from sparc.client.services.metadata import DatasetRecord, MetadataService
 
 test_dir = os.path.dirname(__file__)
 config_dir = os.path.join(test_dir, "resources")
@@ -149,3 +155,293 @@ def test_metadata_search_badbody():
 def test_metadata_close():
     close_result = client.metadata.close()
     assert close_result is None
+
+
+# Test the HTTP session is reused between the calls
+@responses.activate
+def test_metadata_session_reused():
+    responses.add(responses.GET, "https://api.test/_search", json={"hits": {}}, status=200)
+    responses.add(responses.POST, "https://api.test/_search", json={"hits": {}}, status=200)
+
+    metadata = MetadataService(
+        config={
+            "scicrunch_api_key": "key",
+            "pennsieve_profile_name": "test",
+            "metadata_pool_size": "4",
+        }
+    )
+    assert metadata.pool_size == 4
+    adapter = metadata._session.get_adapter("https://api.test")
+    assert adapter._pool_maxsize == 4
+
+    session = metadata._session
+    metadata.algolia_api = "https://api.test/_search"
+    assert metadata.list_datasets() == {"hits": {}}
+    assert metadata.search_datasets() == {"hits": {}}
+    assert metadata._session is session
+    assert len(responses.calls) == 2
+    metadata.close()
+
+
+def _search_callback(request, total=25, search_after=True):
+    body = json.loads(request.body)
+    if "search_after" in body:
+        if not search_after:
+            return (400, {}, json.dumps({"status": 400}))
+        start = body["search_after"][0] + 1
+    else:
+        start = body.get("from", 0)
+    hits = [
+        {"_id": str(i), "sort": [i]}
+        for i in range(start, min(start + body.get("size", 10), total))
+    ]
+    return (200, {}, json.dumps({"hits": {"total": total, "hits": hits}}))
+
+
+# Test iterating over the datasets with search_after pagination
+@responses.activate
+def test_metadata_iter_datasets_search_after():
+    responses.add_callback(responses.POST, "https://api.test/_search", callback=_search_callback)
+
+    metadata = MetadataService()
+    metadata.algolia_api = "https://api.test/_search"
+    hits = list(metadata.iter_datasets(page_size=10, sort=[{"_id": "asc"}]))
+
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(25)]
+    assert len(responses.calls) == 3
+    assert "search_after" in json.loads(responses.calls[2].request.body)
+
+
+# Test iterating over the datasets falls back to from/size pagination
+@responses.activate
+def test_metadata_iter_datasets_from_size():
+    responses.add_callback(
+        responses.POST,
+        "https://api.test/_search",
+        callback=lambda request: _search_callback(request, search_after=False),
+    )
+
+    metadata = MetadataService()
+    metadata.algolia_api = "https://api.test/_search"
+    hits = list(metadata.iter_datasets(page_size=10, sort=[{"_id": "asc"}]))
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(25)]
+
+    hits = list(metadata.iter_datasets(page_size=10, max_items=12))
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(12)]
+
+
+# Test responses are cached in memory
+def test_metadata_cache(local_server):
+    local_server.routes[("POST", "/_search")] = lambda request: (200, {}, b'{"hits": {}}')
+
+    metadata = MetadataService(
+        config={"pennsieve_profile_name": "test", "metadata_cache_ttl": "60"}
+    )
+    metadata.algolia_api = local_server.url + "/_search"
+
+    assert metadata.search_datasets('{"size": 1, "query": {"match_all": {}}}') == {"hits": {}}
+    assert metadata.search_datasets({"query": {"match_all": {}}, "size": 1}) == {"hits": {}}
+    assert metadata.search_datasets({"query": {"match_all": {}}, "size": 2}) == {"hits": {}}
+    assert len(local_server.requests) == 2
+    assert metadata.cache.stats() == {"hits": 1, "misses": 2, "size": 2}
+
+    # changes of a returned result do not change the stored response
+    metadata.search_datasets({"query": {"match_all": {}}, "size": 2})["hits"]["hits"] = [1]
+    assert metadata.search_datasets({"query": {"match_all": {}}, "size": 2}) == {"hits": {}}
+    assert len(local_server.requests) == 2
+
+    metadata.cache.ttl = 0
+    metadata.cache.clear()
+    metadata.search_datasets({"query": {"match_all": {}}, "size": 2})
+    metadata.search_datasets({"query": {"match_all": {}}, "size": 2})
+    assert len(local_server.requests) == 4
+
+
+# Test responses are cached on disk and shared between the services
+def test_metadata_cache_sqlite(local_server, tmp_path):
+    local_server.routes[("GET", "/_search")] = lambda request: (200, {}, b'{"hits": {}}')
+    config = {
+        "pennsieve_profile_name": "test",
+        "metadata_cache_ttl": "60",
+        "metadata_cache_size": "1",
+        "metadata_cache_path": str(tmp_path / "cache.sqlite"),
+    }
+
+    for _ in range(2):
+        metadata = MetadataService(config=config)
+        assert metadata.getURL(local_server.url + "/_search?size=1&from=0") == {"hits": {}}
+        assert metadata.getURL(local_server.url + "/_search?from=0&size=1") == {"hits": {}}
+    assert len(local_server.requests) == 1
+    assert metadata.cache.stats() == {"hits": 2, "misses": 0, "size": 1}
+
+    metadata.getURL(local_server.url + "/_search?from=1&size=1")
+    assert len(metadata.cache) == 1
+
+
+# Test asynchronous variants of the functions
+def test_metadata_async():
+    metadata = MetadataService()
+    metadata.algolia_api = "https://api.test/_search"
+
+    async def search():
+        queries = [{"query": {"term": {"_id": i}}} for i in range(5)]
+        results = await asyncio.gather(*[metadata.asearch_datasets(q) for q in queries])
+        hits = [hit async for hit in metadata.aiter_datasets(page_size=10, max_items=15)]
+        page = await metadata.alist_datasets()
+        return results, hits, page
+
+    with responses.RequestsMock() as mock:
+        mock.add_callback(responses.POST, "https://api.test/_search", callback=_search_callback)
+        mock.add(responses.GET, "https://api.test/_search", json={"hits": {}}, status=200)
+        results, hits, page = asyncio.run(search())
+
+    assert len(results) == 5
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(15)]
+    assert page == {"hits": {}}
+    metadata.close()
+
+
+# Test batch search with _msearch requests
+@responses.activate
+def test_metadata_search_datasets_batch():
+    def msearch_callback(request):
+        lines = request.body.decode().splitlines()
+        assert request.headers["Content-Type"] == "application/x-ndjson"
+        queries = [json.loads(line) for line in lines[1::2]]
+        return (200, {}, json.dumps({"responses": [{"query": q} for q in queries]}))
+
+    responses.add_callback(
+        responses.POST, "https://api.test/index/_msearch", callback=msearch_callback
+    )
+
+    metadata = MetadataService()
+    metadata.algolia_api = "https://api.test/index/_search"
+    queries = [{"query": {"term": {"_id": i}}} for i in range(7)]
+    queries[0] = json.dumps(queries[0])
+
+    results = metadata.search_datasets_batch(queries, chunk_size=3)
+    assert [r["query"]["query"]["term"]["_id"] for r in results] == list(range(7))
+    assert len(responses.calls) == 3
+
+
+# Test filtering of the fields returned
+@responses.activate
+def test_metadata_fields():
+    hit = {"_id": "1", "_score": 1.0, "_source": {"item": {"name": "name"}}}
+    responses.add(
+        responses.GET,
+        "https://api.scicrunch.io/elastic/v1/SPARC_Algolia_pr/_search",
+        json={"hits": {"hits": [hit]}},
+        status=200,
+    )
+    responses.add(
+        responses.POST,
+        "https://api.scicrunch.io/elastic/v1/SPARC_Algolia_pr/_search",
+        json={"hits": {"hits": [hit]}},
+        status=200,
+    )
+
+    metadata = MetadataService()
+    result = metadata.list_datasets(fields=["item.name"], exclude_fields=["objects"])
+    assert "_source=item.name&_source_excludes=objects" in responses.calls[0].request.url
+
+    metadata.search_datasets('{"query": {"match_all": {}}}', fields=["item.name"])
+    body = json.loads(responses.calls[1].request.body)
+    assert body == {"query": {"match_all": {}}, "_source": {"includes": ["item.name"]}}
+
+    records = metadata.to_records(result)
+    assert records == [DatasetRecord("1", 1.0, {"item": {"name": "name"}})]
+    assert records[0].source["item"]["name"] == "name"
+
+    # the filtering of the query is merged with the fields
+    query = {
+        "query": {"match_all": {}},
+        "_source": {"includes": ["item"], "excludes": ["pennsieve"]},
+    }
+    metadata.search_datasets(query, fields=["item.name"], exclude_fields=["objects"])
+    body = json.loads(responses.calls[2].request.body)
+    assert body["_source"] == {
+        "includes": ["item", "item.name"],
+        "excludes": ["pennsieve", "objects"],
+    }
+    assert query["_source"] == {"includes": ["item"], "excludes": ["pennsieve"]}
+    metadata.search_datasets('{"_source": "item"}', exclude_fields=["objects"])
+    body = json.loads(responses.calls[3].request.body)
+    assert body["_source"] == {"includes": ["item"], "excludes": ["objects"]}
+
+    # the fields cannot be filtered by other endpoints
+    metadata.algolia_api = "https://example.com/search"
+    with pytest.raises(ValueError):
+        metadata.list_datasets(fields=["item.name"])
+
+
+# Test incremental decoding of the items of a JSON array
+def test_iter_json_items():
+    document = {
+        "took": 1,
+        "hits": {
+            "total": {"value": 3, "hits": [0]},
+            "max_score": 1.5,
+            "hits": [{"_id": "a", "_source": {"name": 'x"}]{'}}, {"_id": "ż"}, 123456],
+        },
+        "other": [1, 2],
+    }
+    data = json.dumps(document, ensure_ascii=False).encode("utf-8")
+
+    for chunk_size in (1, 2, 7, len(data)):
+        chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+        items = list(iter_json_items(chunks, ("hits", "hits")))
+        assert items == document["hits"]["hits"]
+
+    assert list(iter_json_items([data], ("missing",))) == []
+
+
+# Test streaming the datasets from a local server
+def test_metadata_stream_datasets(local_server):
+    def search(request):
+        body = json.loads(request.body)
+        start = body.get("from", 0)
+        hits = [{"_id": str(i)} for i in range(start, min(start + body.get("size", 10), 25))]
+        return (200, {}, json.dumps({"hits": {"total": 25, "hits": hits}}).encode())
+
+    local_server.routes[("POST", "/_search")] = search
+    metadata = MetadataService()
+    metadata.algolia_api = local_server.url + "/_search"
+
+    hits = list(metadata.stream_datasets('{"size": 5}', fields=["_id"]))
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(5)]
+    assert json.loads(local_server.requests[0].body)["_source"] == {"includes": ["_id"]}
+
+    hits = list(metadata.iter_datasets(page_size=10, stream=True))
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(25)]
+    hits = list(metadata.iter_datasets(page_size=10, max_items=12, stream=True))
+    assert [hit["_id"] for hit in hits] == [str(i) for i in range(12)]
+
+    metadata.algolia_api = local_server.url + "/missing"
+    with pytest.raises(RuntimeError):
+        metadata.stream_datasets()
+
+
+# Test the streamed response is released if the async consumer stops early
+def test_metadata_aiter_datasets_close(local_server, mocker):
+    hits = [{"_id": str(i)} for i in range(10)]
+    local_server.routes[("POST", "/_search")] = lambda request: (
+        200,
+        {},
+        json.dumps({"hits": {"hits": hits}}).encode(),
+    )
+    metadata = MetadataService()
+    metadata.algolia_api = local_server.url + "/_search"
+    post = mocker.spy(metadata._session, "post")
+    iter_datasets = mocker.spy(metadata, "iter_datasets")
+
+    async def first_hit():
+        datasets = metadata.aiter_datasets(page_size=10, stream=True)
+        async for hit in datasets:
+            break
+        await datasets.aclose()
+        return hit
+
+    assert asyncio.run(first_hit()) == {"_id": "0"}
+    assert iter_datasets.spy_return.gi_frame is None
+    assert post.spy_return.raw.closed
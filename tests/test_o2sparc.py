@@ -1,4 +1,7 @@
+import asyncio
 import copy
+import hashlib
+from concurrent.futures import FIRST_COMPLETED
 from http import HTTPStatus
 from pathlib import Path
 from typing import Any, Dict
@@ -10,7 +13,7 @@ import pytest
 from pytest import MonkeyPatch
 from pytest_mock import MockerFixture
 
-from sparc.client.services.o2sparc import O2SparcService, O2SparcSolver
+from sparc.client.services.o2sparc import JobStatus, LazyFile, O2SparcService, O2SparcSolver
 
 EnvVarsDict = Dict[str, str]
 Solver_Dict = Dict[str, str]
@@ -242,7 +245,8 @@ def test_get_job_results(
     job_inputs: dict[str, Any] = {"my_float": 4.36}
     file: osparc.File = osparc.File(id=456, filename=tmp_file)
     results: dict[str, Any] = {"my_result_float": 2.34, "my_result_file": file}
-    mocker.patch("osparc.FilesApi.download_file", return_value=str(file.filename))
+    response = mocker.Mock(stream=lambda chunk_size: iter([tmp_file.read_bytes()]))
+    mocker.patch("osparc.FilesApi.download_file", return_value=response)
     mocker.patch(
         "osparc.SolversApi.get_job_outputs",
         return_value=osparc.JobOutputs(job_id="123", results=results),
@@ -253,7 +257,8 @@ def test_get_job_results(
     job_id = dummy_solver.submit_job(job_inputs)
     dummy_results = dummy_solver.get_results(job_id)
     assert results["my_result_float"] == dummy_results["my_result_float"]
-    assert results["my_result_file"].filename == dummy_results["my_result_file"]
+    assert dummy_results["my_result_file"].name == tmp_file.name
+    assert dummy_results["my_result_file"].read_text() == "my test file"
 
     # check we cannot retrieve results if job not done
     job_status.stopped_at = None
@@ -303,3 +308,307 @@ def test_get_solver(dummy_solver: O2SparcSolver) -> None:
     o2p = O2SparcService(connect=False, config=config)
     solver = o2p.get_solver("mykey", "myid")
     assert isinstance(solver, O2SparcSolver)
+
+
+def test_submit_jobs(tmp_path: Path, mocker: MockerFixture, dummy_solver: O2SparcSolver):
+    """
+    Test submit_jobs uploads each distinct file once and keeps the order of the jobs
+    """
+    mesh: Path = tmp_path / "mesh.txt"
+    mesh.write_text("shared mesh")
+    configs: list[Path] = []
+    for i in range(3):
+        configs.append(tmp_path / f"config{i}.txt")
+        configs[-1].write_text(f"config {i}")
+
+    uploaded: list[Path] = []
+
+    def upload_file(self, file: Path) -> osparc.File:
+        uploaded.append(file)
+        return osparc.File(id=file.name, filename=file.name)
+
+    def create_job(self, solver_id, solver_version, inputs) -> osparc.Job:
+        job = generate_dummy_job(inputs)
+        job.id = f"job-{inputs.values['index']}"
+        return job
+
+    mocker.patch("osparc.FilesApi.upload_file", upload_file)
+    mocker.patch("osparc.SolversApi.create_job", create_job)
+    start_job = mocker.patch("osparc.SolversApi.start_job", return_value=None)
+
+    jobs_inputs: list[dict[str, Any]] = [
+        {"index": i, "mesh": tmp_path / ".." / tmp_path.name / "mesh.txt", "config": config}
+        for i, config in enumerate(configs)
+    ]
+    job_ids = dummy_solver.submit_jobs(jobs_inputs, max_workers=3)
+
+    assert job_ids == ["job-0", "job-1", "job-2"]
+    assert sorted(file.name for file in uploaded) == [
+        "config0.txt",
+        "config1.txt",
+        "config2.txt",
+        "mesh.txt",
+    ]
+    assert start_job.call_count == 3
+
+    # test directory are not valid job inputs
+    with pytest.raises(RuntimeError):
+        dummy_solver.submit_jobs([{"my_dir": tmp_path}])
+
+    # the jobs started before and after a failed one are recorded
+    def failing_create_job(self, solver_id, solver_version, inputs) -> osparc.Job:
+        if inputs.values["index"] == 1:
+            raise osparc.ApiException(HTTPStatus.INTERNAL_SERVER_ERROR)
+        return create_job(self, solver_id, solver_version, inputs)
+
+    mocker.patch("osparc.SolversApi.create_job", failing_create_job)
+    with pytest.raises(RuntimeError, match="1 of 3 jobs failed") as error:
+        dummy_solver.submit_jobs(jobs_inputs, max_workers=1)
+    assert error.value.job_ids == ["job-0", None, "job-2"]
+    assert isinstance(error.value.__cause__, osparc.ApiException)
+    assert [job.id for job in dummy_solver._jobs[-2:]] == ["job-0", "job-2"]
+
+
+def test_upload_deduplication(tmp_path: Path, mocker: MockerFixture, mock_envs: EnvVarsDict):
+    """
+    Test identical input files are uploaded once, also across sessions
+    """
+    mesh: Path = tmp_path / "mesh.txt"
+    mesh.write_text("mesh")
+    copy_of_mesh: Path = tmp_path / "copy_of_mesh.txt"
+    copy_of_mesh.write_text("mesh")
+    md5 = hashlib.md5(b"mesh").hexdigest()
+
+    server_files: dict[str, osparc.File] = {}
+
+    def upload_file(self, file: Path) -> osparc.File:
+        file_id = f"file-{len(server_files)}"
+        server_files[file_id] = osparc.File(id=file_id, filename=file.name, checksum=md5)
+        return server_files[file_id]
+
+    def get_file(self, file_id: str) -> osparc.File:
+        if file_id not in server_files:
+            raise osparc.ApiException(HTTPStatus.NOT_FOUND)
+        return server_files[file_id]
+
+    mocker.patch("osparc.SolversApi.get_solver_release")
+    mocker.patch("osparc.SolversApi.create_job", create_job_mock)
+    mocker.patch("osparc.SolversApi.start_job", return_value=None)
+    upload = mocker.patch("osparc.FilesApi.upload_file", side_effect=upload_file, autospec=True)
+    mocker.patch("osparc.FilesApi.get_file", get_file)
+
+    config = {"o2sparc_upload_cache_path": str(tmp_path / "uploads.db")}
+    solver = O2SparcService(config, connect=False).get_solver("key", "1.0.0")
+    solver.submit_job({"mesh": mesh, "copy": copy_of_mesh})
+    assert upload.call_count == 1
+    assert create_job_mock.inputs.values["mesh"] is create_job_mock.inputs.values["copy"]
+
+    # the file uploaded in the previous session is reused
+    solver = O2SparcService(config, connect=False).get_solver("key", "1.0.0")
+    solver.submit_job({"mesh": mesh})
+    assert upload.call_count == 1
+    assert create_job_mock.inputs.values["mesh"].id == "file-0"
+
+    # the file is uploaded again if it was removed from the server or its content differs
+    server_files.clear()
+    solver.submit_job({"mesh": mesh})
+    assert upload.call_count == 2
+    server_files["file-0"].checksum = "other"
+    solver.submit_job({"mesh": mesh})
+    assert upload.call_count == 3
+
+
+def test_upload_without_cache(tmp_path: Path, mocker: MockerFixture, dummy_solver: O2SparcSolver):
+    """
+    Test only the files of the same size are hashed without the upload cache
+    """
+    inputs: dict[str, Path] = {}
+    for name, content in [("mesh", "mesh"), ("copy", "mesh"), ("other", "data"), ("big", "0" * 9)]:
+        inputs[name] = tmp_path / f"{name}.txt"
+        inputs[name].write_text(content)
+
+    upload = mocker.patch(
+        "osparc.FilesApi.upload_file",
+        side_effect=lambda self, file: osparc.File(id=file.name, filename=file.name),
+        autospec=True,
+    )
+    hash_file = mocker.spy(dummy_solver, "_hash_file")
+    dummy_solver.submit_job(inputs)
+    assert sorted(call.args[0].name for call in hash_file.call_args_list) == [
+        "copy.txt",
+        "mesh.txt",
+        "other.txt",
+    ]
+    assert sorted(call.args[1].name for call in upload.call_args_list) == [
+        "big.txt",
+        "mesh.txt",
+        "other.txt",
+    ]
+    assert create_job_mock.inputs.values["copy"] is create_job_mock.inputs.values["mesh"]
+
+
+def test_wait_for_jobs(mocker: MockerFixture, dummy_solver: O2SparcSolver):
+    """
+    Test jobs are polled with a single request per job and adaptive intervals
+    """
+    # the number of polls after which each job progresses and completes
+    polls: dict[str, int] = {"a": 0, "b": 0}
+    finish: dict[str, int] = {"a": 2, "b": 5}
+
+    def inspect_job(self, solver_id, solver_version, job_id) -> osparc.JobStatus:
+        polls[job_id] += 1
+        done = polls[job_id] >= finish[job_id]
+        return osparc.JobStatus(
+            job_id=job_id,
+            state="SUCCESS" if done else "STARTED",
+            progress=100 if done else min(polls[job_id], 2) * 10,
+            submitted_at=1.0,
+            stopped_at=2.0 if done else None,
+        )
+
+    mocker.patch("osparc.SolversApi.inspect_job", inspect_job)
+    sleep = mocker.patch("time.sleep")
+    changes: list[JobStatus] = []
+
+    statuses = dummy_solver.wait_for_jobs(["a", "b"], on_progress=changes.append)
+    assert statuses == {
+        "a": JobStatus("a", "SUCCESS", 1.0, True),
+        "b": JobStatus("b", "SUCCESS", 1.0, True),
+    }
+    # the completed jobs are not polled anymore
+    assert polls == {"a": 2, "b": 5}
+    assert [status.progress for status in changes if status.job_id == "b"] == [0.1, 0.2, 1.0]
+    # the interval grows while nothing changes
+    assert [c.args[0] for c in sleep.call_args_list] == [1.0, 1.0, 2.0, 4.0]
+
+    polls.update(a=0, b=0)
+    statuses = dummy_solver.wait_for_jobs(["a", "b"], return_when=FIRST_COMPLETED)
+    assert statuses["a"].done and not statuses["b"].done
+
+    with pytest.raises(ValueError):
+        dummy_solver.wait_for_jobs(["a"], return_when="FIRST_EXCEPTION")
+
+
+def test_async(mocker: MockerFixture, dummy_solver: O2SparcSolver):
+    """
+    Test the async functions run the blocking calls and stream the job status
+    """
+    polls: list[int] = []
+
+    def inspect_job(self, solver_id, solver_version, job_id) -> osparc.JobStatus:
+        polls.append(len(polls))
+        done = len(polls) >= 4
+        return osparc.JobStatus(
+            job_id=job_id,
+            state="SUCCESS" if done else "STARTED",
+            progress=100 if done else 50,
+            submitted_at=1.0,
+            stopped_at=2.0 if done else None,
+        )
+
+    mocker.patch("osparc.SolversApi.inspect_job", inspect_job)
+    mocker.patch(
+        "osparc.SolversApi.get_job_outputs",
+        return_value=osparc.JobOutputs(job_id="123", results={"my_result": 2.34}),
+    )
+    sleeps: list[float] = []
+
+    async def sleep(interval: float) -> None:
+        sleeps.append(interval)
+
+    mocker.patch("asyncio.sleep", sleep)
+
+    async def run() -> tuple:
+        job_ids = await asyncio.gather(*[dummy_solver.asubmit_job({"i": i}) for i in range(3)])
+        progress = await dummy_solver.aget_job_progress(job_ids[0])
+        statuses = [status async for status in dummy_solver.astream_job_status(job_ids[0])]
+        results = await dummy_solver.aget_results(job_ids[0])
+        return job_ids, progress, statuses, results
+
+    job_ids, progress, statuses, results = asyncio.run(run())
+    assert len(job_ids) == 3
+    assert progress == 0.5
+    assert [status.progress for status in statuses] == [0.5, 1.0]
+    assert statuses[-1].done
+    assert sleeps == [1.0, 2.0]
+    assert results == {"my_result": 2.34}
+
+    # the executor created on demand is shut down by the solver
+    executor = dummy_solver._executor
+    with dummy_solver:
+        pass
+    assert executor._shutdown
+    assert dummy_solver._executor is None
+
+    # the executor of the service is shut down only by the service
+    o2p = O2SparcService(config={"o2sparc_max_workers": "2"}, connect=False)
+    solver = asyncio.run(o2p.aget_solver("key", "1.0.0"))
+    assert isinstance(solver, O2SparcSolver)
+    solver.close()
+    assert not o2p._executor._shutdown
+    o2p.close()
+
+
+def test_get_job_results_dest_dir(
+    tmp_path: Path, mocker: MockerFixture, dummy_solver: O2SparcSolver
+):
+    """
+    Test the output files are streamed concurrently into a directory or lazily
+    """
+    contents: dict[str, bytes] = {"a": b"a" * 1000, "b": b"b" * 10}
+    results: dict[str, Any] = {
+        "my_result_float": 2.34,
+        "output_1": osparc.File(id="a", filename="result.txt"),
+        "output_2": osparc.File(id="b", filename="result.txt"),
+    }
+
+    class Response:
+        def __init__(self, content: bytes):
+            self.content = content
+            self.released = False
+
+        def stream(self, chunk_size: int):
+            for i in range(0, len(self.content), 100):
+                yield self.content[i : i + 100]
+
+        def release_conn(self):
+            self.released = True
+
+    def download_file(self, file_id: str, _preload_content: bool = True) -> Response:
+        assert not _preload_content
+        return Response(contents[file_id])
+
+    mocker.patch("osparc.FilesApi.download_file", download_file)
+    inspect_job = mocker.patch("osparc.SolversApi.inspect_job")
+    mocker.patch(
+        "osparc.SolversApi.get_job_outputs",
+        return_value=osparc.JobOutputs(job_id="123", results=results),
+    )
+
+    dummy_results = dummy_solver.get_results("123", dest_dir=tmp_path, skip_status_check=True)
+    assert not inspect_job.called
+    assert dummy_results["my_result_float"] == 2.34
+    assert dummy_results["output_1"] == tmp_path / "output_1" / "result.txt"
+    assert dummy_results["output_1"].read_bytes() == contents["a"]
+    assert dummy_results["output_2"].read_bytes() == contents["b"]
+    assert not list(tmp_path.glob("**/*.part"))
+
+    download = mocker.patch(
+        "osparc.FilesApi.download_file", side_effect=download_file, autospec=True
+    )
+    lazy_results = dummy_solver.get_results(
+        "123", dest_dir=tmp_path / "lazy", skip_status_check=True, lazy=True
+    )
+    assert isinstance(lazy_results["output_1"], LazyFile)
+    assert not download.called
+    with open(lazy_results["output_2"], "rb") as f:
+        assert f.read() == contents["b"]
+    assert download.call_count == 1
+    assert not lazy_results["output_1"].downloaded
+
+    # the outputs with the same filename are streamed into separate temporary directories
+    temp_results = dummy_solver.get_results("123", skip_status_check=True)
+    assert temp_results["output_1"].name == temp_results["output_2"].name == "result.txt"
+    assert temp_results["output_1"].parent != temp_results["output_2"].parent
+    assert temp_results["output_1"].read_bytes() == contents["a"]
+    assert temp_results["output_2"].read_bytes() == contents["b"]
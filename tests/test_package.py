@@ -1,5 +1,47 @@
+import os
+import subprocess
+import sys
+
 import sparc.client
 
+# The heavy dependencies of the services are stubbed out, so that importing any of them fails
+IMPORT_TIME_SCRIPT = """
+import sys
+import time
+
+for name in ("osparc", "pennsieve2", "requests", "cmlibs", "scaffoldmaker"):
+    sys.modules[name] = None
+
+start = time.perf_counter()
+import sparc.client
+print(time.perf_counter() - start)
+"""
+
+# Budget (in seconds) for importing sparc.client
+IMPORT_TIME_BUDGET = 1.0
+
 
 def test_version():
     assert sparc.client.__version__
+
+
+def test_import_time():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_TIME_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    assert float(result.stdout) < IMPORT_TIME_BUDGET
+
+
+def test_services_registry():
+    from sparc.client.services import SERVICES, get_services, load_service
+
+    assert set(SERVICES) <= set(get_services())
+
+    from sparc.client.services.metadata import MetadataService
+
+    assert load_service(SERVICES["metadata"]) is MetadataService
+    assert sparc.client.services.MetadataService is MetadataService
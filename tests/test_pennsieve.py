@@ -1,3 +1,16 @@
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from sparc.client.services._cache import FileCache
+from sparc.client.services._ratelimit import RateLimiter
+from sparc.client.services._zipstream import iter_zip_entries
 from sparc.client.services.pennsieve import PennsieveService
 
 
@@ -220,15 +233,25 @@ def test_download(mocker, mock_pennsieve):
     class PennsieveResponse:
         status_code = 200
         content = b'{"content" : "content}'
+        headers = {}
 
-    def response(url=None, json=None, headers=None):
+        def iter_content(self, chunk_size=None):
+            yield self.content
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    def response(url=None, json=None, headers=None, stream=None, timeout=None):
         return PennsieveResponse()
 
-    mocker.patch("requests.post", response)
     mocker.patch("os.open")
     mocker.patch("os.write")
 
     p = PennsieveService(connect=False)
+    mocker.patch.object(p._session, "post", response)
     response = p.download_file(file_list=file_list)
     assert response.status_code == 200
 
@@ -267,17 +290,617 @@ def test_download_multiple(mocker, mock_pennsieve):
     class PennsieveResponse:
         status_code = 200
         content = b'{"content" : "content}'
+        headers = {}
+
+        def iter_content(self, chunk_size=None):
+            yield self.content
+
+        def __enter__(self):
+            return self
 
-    def response(url=None, json=None, headers=None):
+        def __exit__(self, *args):
+            pass
+
+    def response(url=None, json=None, headers=None, stream=None, timeout=None):
         return PennsieveResponse()
 
-    mocker.patch("requests.post", response)
     mocker.patch("os.open")
     mocker.patch("os.write")
 
     p = PennsieveService(connect=False)
+    mocker.patch.object(p._session, "post", response)
     response = p.download_file(file_list=file_list)
     assert response.status_code == 200
 
     response = p.download_file(file_list=file_list, output_name="test")
     assert response.status_code == 200
+
+
+def _paginated_get(total, key):
+    def get(url, headers=None, params=None):
+        offset, limit = params["offset"], params["limit"]
+        items = [{"id": i} for i in range(offset, min(offset + limit, total))]
+        return {"limit": limit, "offset": offset, "totalCount": total, key: items}
+
+    return get
+
+
+def test_iter_datasets(mocker):
+    get = mocker.patch("pennsieve2.Pennsieve.get", side_effect=_paginated_get(95, "datasets"))
+    p = PennsieveService(connect=False)
+    actual = [d["id"] for d in p.iter_datasets(page_size=10, max_workers=3, tags=["tag"])]
+    assert actual == list(range(95))
+    assert get.call_count == 10
+    assert get.call_args.kwargs["params"]["tags"] == ["tag"]
+
+    actual = [d["id"] for d in p.iter_datasets(page_size=10, max_items=25)]
+    assert actual == list(range(25))
+
+
+def test_iter_files_records(mocker):
+    mocker.patch("pennsieve2.Pennsieve.get", side_effect=_paginated_get(7, "files"))
+    p = PennsieveService(connect=False)
+    assert [f["id"] for f in p.iter_files(page_size=2, dataset_id=1)] == list(range(7))
+
+    mocker.patch("pennsieve2.Pennsieve.get", side_effect=_paginated_get(5, "records"))
+    assert [r["id"] for r in p.iter_records(page_size=5, max_items=3)] == list(range(3))
+
+
+def test_iter_pages_failed_page(mocker):
+    get_page = _paginated_get(50, "datasets")
+
+    def get(url, headers=None, params=None):
+        # Pennsieve.get returns None if the request failed
+        return None if params["offset"] == 20 else get_page(url, headers, params)
+
+    mocker.patch("pennsieve2.Pennsieve.get", side_effect=get)
+    p = PennsieveService(connect=False)
+    datasets = p.iter_datasets(page_size=10, max_workers=2)
+    assert [next(datasets)["id"] for _ in range(20)] == list(range(20))
+    with pytest.raises(RuntimeError, match="/discover/search/datasets at offset 20"):
+        next(datasets)
+
+
+def test_download_streaming(mocker, tmp_path):
+    content = bytes(range(256)) * 100
+
+    class PennsieveResponse:
+        status_code = 200
+        headers = {"content-length": str(len(content))}
+
+        def iter_content(self, chunk_size=None):
+            for i in range(0, len(content), chunk_size):
+                yield content[i : i + chunk_size]
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            pass
+
+    progress = []
+    output_name = str(tmp_path / "file.bin")
+
+    p = PennsieveService(connect=False)
+    mocker.patch.object(p._session, "post", return_value=PennsieveResponse())
+    response = p.download_file(
+        {"name": "file.bin", "datasetId": 1, "datasetVersion": 1, "uri": "s3://a/1/1/file.bin"},
+        output_name=output_name,
+        chunk_size=1000,
+        progress=lambda written, total: progress.append((written, total)),
+    )
+    with open(output_name, "rb") as f:
+        assert f.read() == content
+    assert response.checksum == hashlib.sha256(content).hexdigest()
+    assert len(progress) == 26
+    assert progress[-1] == (len(content), len(content))
+    assert not os.path.exists(output_name + ".part")
+
+    def failing_content(chunk_size=None):
+        yield content[:10]
+        raise ConnectionError()
+
+    response.iter_content = failing_content
+    with pytest.raises(ConnectionError):
+        p.download_file({"name": "file.bin", "datasetId": 1, "datasetVersion": 1}, output_name)
+    assert not os.path.exists(output_name + ".part")
+
+
+def test_download_resume(local_server, tmp_path):
+    content = bytes(range(256)) * 400
+    state = {"fail": True, "ranges": []}
+
+    def zipit(request):
+        headers = {"ETag": '"v1"'}
+        range_header = request.headers.get("Range")
+        state["ranges"].append(range_header)
+        if state["fail"]:
+            # send only a half of the content and drop the connection
+            state["fail"] = False
+            request.close_connection = True
+            headers["Content-Length"] = str(len(content))
+            return 200, headers, content[: len(content) // 2]
+        if range_header is not None and state.get("ranges_supported", True):
+            start = int(range_header[len("bytes=") : -1])
+            headers["Content-Range"] = f"bytes {start}-{len(content) - 1}/{len(content)}"
+            return 206, headers, content[start:]
+        return 200, headers, content
+
+    local_server.routes[("POST", "/zipit/discover")] = zipit
+    file = {"name": "file.bin", "datasetId": 1, "datasetVersion": 1, "uri": "s3://a/1/1/file.bin"}
+    output_name = str(tmp_path / "file.bin")
+
+    p = PennsieveService(connect=False)
+    p.host_api = local_server.url
+    with pytest.raises(Exception):
+        p.download_file(file, output_name, chunk_size=1000, resume=True)
+    offset = os.path.getsize(output_name + ".part")
+    assert 0 < offset <= len(content) // 2
+    assert os.path.exists(output_name + ".part.json")
+
+    progress = []
+    response = p.download_file(
+        file, output_name, resume=True, progress=lambda *args: progress.append(args)
+    )
+    assert response.status_code == 206
+    assert state["ranges"] == [None, f"bytes={offset}-"]
+    assert progress[-1] == (len(content), len(content))
+    assert response.checksum == hashlib.sha256(content).hexdigest()
+    with open(output_name, "rb") as f:
+        assert f.read() == content
+    assert not os.path.exists(output_name + ".part")
+    assert not os.path.exists(output_name + ".part.json")
+
+    # restart the download if the server does not support range requests
+    state.update(fail=True, ranges_supported=False)
+    with pytest.raises(Exception):
+        p.download_file(file, output_name, chunk_size=1000, resume=True)
+    response = p.download_file(file, output_name, resume=True)
+    assert response.status_code == 200
+    with open(output_name, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_resume_invalid_range(local_server, tmp_path):
+    content = bytes(range(256)) * 4
+    state = {"status": 404, "ranges": []}
+
+    def zipit(request):
+        state["ranges"].append(request.headers.get("Range"))
+        if state["status"] == 404:
+            return 404, {}, b"Not found"
+        if request.headers.get("Range") is not None:
+            # a range starting elsewhere than requested
+            headers = {"Content-Range": f"bytes 0-{len(content) - 1}/{len(content)}"}
+            return 206, headers, content
+        return 200, {}, content
+
+    local_server.routes[("POST", "/zipit/discover")] = zipit
+    file = {"name": "file.bin", "datasetId": 1, "datasetVersion": 1, "uri": "s3://a/1/1/file.bin"}
+    output_name = str(tmp_path / "file.bin")
+    request = {"data": {"paths": ["file.bin"], "datasetId": 1, "version": 1}}
+    with open(output_name + ".part", "wb") as f:
+        f.write(content[:100])
+    with open(output_name + ".part.json", "w") as f:
+        json.dump({"request": request, "etag": None, "last_modified": None}, f)
+
+    p = PennsieveService(connect=False)
+    p.host_api = local_server.url
+    # the error is raised before the partial download is changed
+    with pytest.raises(requests.HTTPError):
+        p.download_file(file, output_name, resume=True)
+    with open(output_name + ".part", "rb") as f:
+        assert f.read() == content[:100]
+
+    state["status"] = 200
+    response = p.download_file(file, output_name, resume=True)
+    assert response.status_code == 200
+    assert state["ranges"] == ["bytes=100-", "bytes=100-", None]
+    with open(output_name, "rb") as f:
+        assert f.read() == content
+
+
+def test_download_files(local_server, tmp_path):
+    contents = {"files/a.txt": b"a" * 100, "files/dir/b.txt": b"b" * 200, "files/c.txt": b"c"}
+
+    def manifest(request):
+        paths = json.loads(request.body)["paths"]
+        data = [
+            {"name": path.split("/")[-1], "path": path, "url": local_server.url + "/s3/" + path}
+            for path in paths
+        ]
+        return 200, {"Content-Type": "application/json"}, json.dumps({"data": data}).encode()
+
+    def zipit(request):
+        path = json.loads(request.body)["data"]["paths"][0]
+        return 200, {}, contents[path]
+
+    local_server.routes[("POST", "/discover/datasets/1/versions/2/files/download-manifest")] = (
+        manifest
+    )
+    local_server.routes[("POST", "/zipit/discover")] = zipit
+    for path, content in contents.items():
+        local_server.routes[("GET", "/s3/" + path)] = lambda request, c=content: (200, {}, c)
+
+    file_list = [
+        {"name": "a.txt", "datasetId": 1, "datasetVersion": 2, "uri": "s3://b/1/2/files/a.txt"},
+        {"name": "c.txt", "datasetId": 3, "datasetVersion": 1, "uri": "s3://b/3/1/files/c.txt"},
+        {
+            "name": "b.txt",
+            "datasetId": 1,
+            "datasetVersion": 2,
+            "uri": "s3://b/1/2/files/dir/b.txt",
+        },
+    ]
+    p = PennsieveService(connect=False)
+    p.host_api = local_server.url
+    output_names = p.download_files(file_list, dest_dir=str(tmp_path), workers=2)
+
+    assert output_names == [
+        str(tmp_path / "1" / "2" / "files" / "a.txt"),
+        str(tmp_path / "3" / "1" / "files" / "c.txt"),
+        str(tmp_path / "1" / "2" / "files" / "dir" / "b.txt"),
+    ]
+    for output_name, path in zip(output_names, ["files/a.txt", "files/c.txt", "files/dir/b.txt"]):
+        with open(output_name, "rb") as f:
+            assert f.read() == contents[path]
+
+    requests = [(r.command, r.path) for r in local_server.requests]
+    assert requests.count(("POST", "/zipit/discover")) == 1
+    assert ("GET", "/s3/files/dir/b.txt") in requests
+
+    with pytest.raises(ValueError):
+        p.download_files(
+            {"name": "x", "datasetId": 1, "datasetVersion": 1, "uri": "s3://b/1/1/../../../x"}
+        )
+
+
+def test_file_cache(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_size=250)
+    for name in ["a", "b", "c"]:
+        with open(tmp_path / name, "wb") as f:
+            f.write(name.encode() * 100)
+
+    assert cache.get((1, 1, "a")) is None
+    cache.put((1, 1, "a"), str(tmp_path / "a"))
+    cache.put((1, 1, "b"), str(tmp_path / "b"))
+    os.utime(cache.get((1, 1, "b")), (0, 0))
+    cache.put((1, 1, "c"), str(tmp_path / "c"))
+
+    # the least recently used file is evicted
+    assert cache.get((1, 1, "b")) is None
+    with open(cache.get((1, 1, "a")), "rb") as f:
+        assert f.read() == b"a" * 100
+    assert cache.stats() == {"hits": 2, "misses": 2, "count": 2, "size": 200}
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_download_file_cache(local_server, tmp_path):
+    content = b"x" * 1000
+    local_server.routes[("POST", "/zipit/discover")] = lambda request: (200, {}, content)
+    file = {"name": "file.bin", "datasetId": 1, "datasetVersion": 1, "uri": "s3://a/1/1/file.bin"}
+
+    p = PennsieveService(
+        config={"pennsieve_profile_name": "test", "pennsieve_cache_dir": str(tmp_path / "cache")},
+        connect=False,
+    )
+    p.host_api = local_server.url
+    first = p.download_file(file, str(tmp_path / "first.bin"))
+    second = p.download_file(file, str(tmp_path / "second.bin"))
+
+    assert len(local_server.requests) == 1
+    assert not getattr(first, "from_cache", False)
+    assert second.from_cache
+    assert second.checksum == first.checksum == hashlib.sha256(content).hexdigest()
+    with open(tmp_path / "second.bin", "rb") as f:
+        assert f.read() == content
+    assert p.file_cache.stats()["hits"] == 1
+
+    output_names = p.download_files(file, dest_dir=str(tmp_path / "out"))
+    assert len(local_server.requests) == 2  # the download manifest only
+    with open(output_names[0], "rb") as f:
+        assert f.read() == content
+
+
+def _streamed_zip(contents):
+    class Stream(io.RawIOBase):
+        def __init__(self):
+            self.data = bytearray()
+
+        def writable(self):
+            return True
+
+        def write(self, b):
+            self.data += b
+            return len(b)
+
+    stream = Stream()
+    with zipfile.ZipFile(stream, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in contents.items():
+            # written with data descriptors, as the size is not known in advance
+            with archive.open(name, "w") as f:
+                f.write(content)
+        archive.writestr("stored.txt", b"PK\x07\x08" * 10, compress_type=zipfile.ZIP_STORED)
+    return bytes(stream.data)
+
+
+def test_iter_zip_entries():
+    contents = {"a.txt": b"a" * 1000, "dir/b.bin": os.urandom(100000), "empty": b""}
+    archive = _streamed_zip(contents)
+    contents["stored.txt"] = b"PK\x07\x08" * 10
+
+    for chunk_size in [1, 1000, len(archive)]:
+        chunks = [archive[i : i + chunk_size] for i in range(0, len(archive), chunk_size)]
+        assert {name: f.read() for name, f in iter_zip_entries(chunks)} == contents
+    # the unread entries are skipped
+    assert [name for name, _ in iter_zip_entries([archive])] == list(contents)
+
+    corrupted = bytearray(archive)
+    corrupted[len(archive) // 2] ^= 0xFF
+    with pytest.raises(zipfile.BadZipFile):
+        [f.read() for _, f in iter_zip_entries([bytes(corrupted)])]
+    with pytest.raises(zipfile.BadZipFile):
+        [f.read() for _, f in iter_zip_entries([archive[:5000]])]
+
+
+def test_download_extract(local_server, tmp_path):
+    contents = {"files/a.txt": b"a" * 1000, "files/dir/b.bin": os.urandom(100000)}
+    archive = _streamed_zip(contents)
+    contents["stored.txt"] = b"PK\x07\x08" * 10
+    local_server.routes[("POST", "/zipit/discover")] = lambda request: (200, {}, archive)
+    file_list = [
+        {"name": "a.txt", "datasetId": 1, "datasetVersion": 1, "uri": "s3://b/1/1/files/a.txt"},
+        {
+            "name": "b.bin",
+            "datasetId": 1,
+            "datasetVersion": 1,
+            "uri": "s3://b/1/1/files/dir/b.bin",
+        },
+    ]
+
+    p = PennsieveService(connect=False)
+    p.host_api = local_server.url
+    progress = []
+    response = p.download_file(
+        file_list, extract_dir=str(tmp_path), progress=lambda *args: progress.append(args)
+    )
+    assert response.files == [str(tmp_path / name) for name in contents]
+    for name, content in contents.items():
+        with open(tmp_path / name, "rb") as f:
+            assert f.read() == content
+    assert response.checksum == hashlib.sha256(archive).hexdigest()
+    assert progress[-1][0] == len(archive)
+    # no archive nor temporary files are left
+    assert sorted(os.listdir(tmp_path)) == ["files", "stored.txt"]
+    assert sorted(os.listdir(tmp_path / "files")) == ["a.txt", "dir"]
+
+    entries = {name: f.read() for name, f in p.iter_archive(file_list)}
+    assert entries == contents
+
+    # a failed request raises an error before anything is extracted
+    local_server.routes[("POST", "/zipit/discover")] = lambda request: (404, {}, b"Not found")
+    with pytest.raises(requests.HTTPError):
+        p.download_file(file_list, extract_dir=str(tmp_path / "failed"))
+    assert not os.path.exists(tmp_path / "failed")
+
+
+def test_session(local_server, tmp_path):
+    content = b"x" * 1000
+    state = {"failures": 1}
+
+    def zipit(request):
+        if state["failures"]:
+            state["failures"] -= 1
+            return 503, {}, b""
+        return 200, {}, content
+
+    local_server.routes[("POST", "/zipit/discover")] = zipit
+    p = PennsieveService(
+        config={
+            "pennsieve_profile_name": "test",
+            "pennsieve_host_api": local_server.url + "/",
+            "pennsieve_pool_size": "2",
+            "pennsieve_timeout": "5",
+        },
+        connect=False,
+    )
+    assert p.host_api == local_server.url
+    assert p.timeout == (5, 5)
+    assert p._session.get_adapter(local_server.url)._pool_maxsize == 2
+
+    file = {"name": "file.bin", "datasetId": 1, "datasetVersion": 1, "uri": "s3://a/1/1/file.bin"}
+    for name in ["first.bin", "second.bin"]:
+        response = p.download_file(file, str(tmp_path / name))
+        assert response.status_code == 200
+        with open(tmp_path / name, "rb") as f:
+            assert f.read() == content
+    # the failed request is retried
+    assert len(local_server.requests) == 3
+
+
+def test_build_manifest(mocker, tmp_path):
+    files = [
+        {"name": "a.json", "fileType": "Json", "size": 10, "uri": "s3://b/7/2/files/a.json"},
+        {"name": "b.xml", "fileType": "XML", "size": 2000, "uri": "s3://b/7/2/files/dir/b.xml"},
+        {"name": "c.json", "fileType": "Json", "size": 500, "uri": "s3://b/7/2/files/dir/c.json"},
+        {"name": "old.json", "fileType": "Json", "size": 1, "uri": "s3://b/7/1/old.json"},
+    ]
+    for file in files:
+        file.update(datasetId=7, datasetVersion=int(file["uri"].split("/")[4]))
+
+    def get(url, headers=None, params=None):
+        if url.endswith("/discover/datasets/7"):
+            return {"id": 7, "version": 2}
+        offset, limit = params["offset"], params["limit"]
+        return {"totalCount": len(files), "files": files[offset : offset + limit]}
+
+    mock_get = mocker.patch("pennsieve2.Pennsieve.get", side_effect=get)
+    p = PennsieveService(connect=False)
+    manifest = p.build_manifest(7, path=str(tmp_path / "manifest.db"), page_size=2)
+
+    assert len(manifest) == 3
+    assert manifest.paths() == ["files/a.json", "files/dir/b.xml", "files/dir/c.json"]
+    assert manifest.paths(glob="files/dir/*") == ["files/dir/b.xml", "files/dir/c.json"]
+    assert manifest.paths(file_type="json", min_size=100) == ["files/dir/c.json"]
+    assert manifest.paths(max_size=1000, limit=1) == ["files/a.json"]
+    assert manifest.query(file_type="XML") == [files[1]]
+
+    # the stored index is reused without listing the files again
+    calls = mock_get.call_count
+    manifest = p.build_manifest(7, 2, path=str(tmp_path / "manifest.db"))
+    assert len(manifest) == 3
+    assert mock_get.call_count == calls
+
+    # the files of the previous versions are usually not indexed
+    with pytest.raises(RuntimeError, match=r"version 3 .* versions \[1, 2\]"):
+        p.build_manifest(7, 3)
+
+
+def test_conditional_requests(local_server, tmp_path):
+    body = json.dumps({"totalCount": 1, "datasets": [{"id": 1, "version": 2}]}).encode()
+
+    def search(request):
+        if request.headers.get("If-None-Match") == '"v2"':
+            return 304, {"ETag": '"v2"'}, b""
+        return 200, {"ETag": '"v2"', "Content-Type": "application/json"}, body
+
+    local_server.routes[("GET", "/discover/search/datasets")] = search
+    config = {
+        "pennsieve_profile_name": "test",
+        "pennsieve_host_api": local_server.url,
+        "pennsieve_validator_cache_path": str(tmp_path / "validators.db"),
+    }
+    # the validators are shared by the workers
+    workers = [PennsieveService(config=config), PennsieveService(config=config)]
+    for p in workers * 2:
+        assert p.list_datasets(limit=1, query="heart") == json.loads(body)
+
+    assert [r.headers.get("If-None-Match") for r in local_server.requests] == [None] + ['"v2"'] * 3
+    # a request with different parameters is not conditional
+    workers[0].list_datasets(limit=2, query="heart")
+    assert local_server.requests[-1].headers.get("If-None-Match") is None
+
+
+def test_conditional_requests_memory(local_server, mocker):
+    body = json.dumps({"totalCount": 1, "datasets": [{"id": 1, "version": 2}]}).encode()
+
+    def search(request):
+        if request.headers.get("If-None-Match") == '"v2"':
+            return 304, {"ETag": '"v2"'}, b""
+        return 200, {"ETag": '"v2"', "Content-Type": "application/json"}, body
+
+    local_server.routes[("GET", "/discover/search/datasets")] = search
+    config = {
+        "pennsieve_profile_name": "test",
+        "pennsieve_host_api": local_server.url,
+        "pennsieve_validator_cache_size": 10,
+    }
+    p = PennsieveService(config=config)
+    # the headers of a connected session
+    mocker.patch.object(
+        p.Pennsieve.http_api,
+        "_get_default_headers",
+        return_value={"Authorization": "Bearer token", "X-ORGANIZATION-ID": "N:organization:1"},
+    )
+    # changes of the returned responses do not change the stored one
+    p.list_datasets(limit=1)["datasets"].clear()
+    p.list_datasets(limit=1)["datasets"].clear()
+    assert p.list_datasets(limit=1) == json.loads(body)
+    assert [r.headers.get("If-None-Match") for r in local_server.requests] == [
+        None,
+        '"v2"',
+        '"v2"',
+    ]
+    assert all(r.headers["Authorization"] == "Bearer token" for r in local_server.requests)
+    assert all(r.headers["X-ORGANIZATION-ID"] == "N:organization:1" for r in local_server.requests)
+
+    local_server.routes[("GET", "/discover/search/datasets")] = lambda request: (404, {}, b"")
+    assert p.list_datasets(limit=2) is None
+
+
+def test_sync_catalog(mocker, tmp_path):
+    catalog = [
+        {"id": 3, "version": 1, "versionPublishedAt": "2024-03-01T00:00:00Z"},
+        {"id": 2, "version": 4, "versionPublishedAt": "2024-02-01T00:00:00Z"},
+        {"id": 1, "version": 1, "versionPublishedAt": "2024-01-01T00:00:00Z"},
+    ] + [
+        {"id": 100 + i, "version": 1, "versionPublishedAt": f"2023-{i:02}-01T00:00:00Z"}
+        for i in range(12, 0, -1)
+    ]
+    requested = []
+
+    def get(url, headers=None, params=None):
+        assert (params["orderBy"], params["orderDirection"]) == ("date", "desc")
+        requested.append(params["offset"])
+        offset, limit = params["offset"], params["limit"]
+        return {"totalCount": len(catalog), "datasets": catalog[offset : offset + limit]}
+
+    mocker.patch("pennsieve2.Pennsieve.get", side_effect=get)
+    p = PennsieveService(connect=False)
+    state_path = str(tmp_path / "state.json")
+
+    assert p.sync_catalog(state_path, page_size=1) == catalog
+    with open(state_path) as f:
+        assert json.load(f)["watermark"] == "2024-03-01T00:00:00Z"
+
+    # a new version of the dataset 2 and a new dataset 4 are published
+    catalog[1:2] = []
+    catalog[:0] = [
+        {"id": 2, "version": 5, "versionPublishedAt": "2024-05-01T00:00:00Z"},
+        {"id": 4, "version": 1, "versionPublishedAt": "2024-04-01T00:00:00Z"},
+    ]
+    requested.clear()
+    assert p.sync_catalog(state_path, page_size=1, max_workers=1) == catalog[:2]
+    # the listing stops shortly after the watermark
+    assert max(requested) < 6
+    assert p.sync_catalog(state_path, page_size=1, max_workers=1) == []
+
+
+def test_get_many(local_server, mocker):
+    body = json.dumps({"id": 1}).encode()
+    local_server.routes[("GET", "/discover/datasets/1")] = lambda request: (
+        200,
+        {"Content-Type": "application/json"},
+        body,
+    )
+    local_server.routes[("GET", "/discover/datasets/2")] = lambda request: (404, {}, b"")
+    local_server.routes[("GET", "/discover/datasets/3")] = lambda request: (500, {}, b"")
+    config = {"pennsieve_profile_name": "test", "pennsieve_host_api": local_server.url}
+    p = PennsieveService(config=config)
+    # the server errors are not retried
+    p._session.mount("http://", HTTPAdapter())
+    auth_headers = mocker.spy(p, "_auth_headers")
+    results = p.get_many(
+        [
+            f"{local_server.url}/discover/datasets/1",
+            "/discover/datasets/2",
+            {"url": f"{local_server.url}/discover/datasets/3", "params": {"limit": 1}},
+            {"params": {"limit": 1}},
+        ],
+        max_workers=3,
+    )
+    assert auth_headers.call_count == 1
+    assert results[0] == {"id": 1}
+    assert isinstance(results[1], requests.HTTPError)
+    assert results[1].response.status_code == 404
+    assert isinstance(results[2], requests.HTTPError)
+    assert results[2].response.status_code == 500
+    # an item without url fails alone
+    assert isinstance(results[3], KeyError)
+    assert all(r.headers["Accept"].startswith("application/json") for r in local_server.requests)
+
+
+def test_rate_limiter(mocker):
+    sleep = mocker.patch("time.sleep")
+    limiter = RateLimiter(rate=10)
+    waits = [limiter.acquire("a") for _ in range(3)] + [limiter.acquire("b")]
+
+    # the calls for the same host are spaced by 1/rate, the other hosts are not delayed
+    assert waits[0] == 0
+    assert waits[1] == pytest.approx(0.1, abs=0.01)
+    assert waits[2] == pytest.approx(0.2, abs=0.01)
+    assert waits[3] == 0
+    assert sleep.call_count == 2
+    assert RateLimiter().acquire("a") == 0